@@ -0,0 +1,461 @@
+# COMMAND LINE ENTRY POINT
+# python -m astro_engine run --scenario solar_system --end 10y --integrator wisdom_holman --dt 2d --every 30d --out run.csv
+# python -m astro_engine view --scenario solar_system
+# python -m astro_engine run --scenario horizons --epoch 2030-01-01 --end 1y --every 30d (vectors from JPL Horizons, cached)
+# python -m astro_engine ephemeris --end 50y --out planets.npz, then run --ephemeris planets.npz --dt 1d to integrate
+# only the small bodies against the fitted planets
+# python -m astro_engine run --end 100y --checkpoint run.npz --checkpoint-every 1y --trajectory run.traj, and after a
+# kill: run --restart run.npz --end 100y --checkpoint run.npz --trajectory run.traj to carry on where it stopped
+# python -m astro_engine replay run.traj --speed 30d (plays the recording back: [ ] speed, b reverse, drag the bar to seek)
+# python -m astro_engine ensemble --members 500 --perturb AsteroidX --sigma-pos 1e6 --sigma-vel 5 --end 1y --out mc.csv
+# python -m astro_engine run --end 1y --event approach:AsteroidX:Earth --event periapsis:Mercury:Sun --event output:30d:Earth
+# --events events.jsonl (event times located between steps, without shrinking them)
+# python -m astro_engine run --end 10y --stats - (a JSON line of per-phase timings, counters and step sizes every 5 s;
+# in the viewer, i shows the same as an overlay)
+# python -m astro_engine ensemble --sweep tolerance=.05,.1,.2 --sweep max_dt=1e4,1e5 --end 10y (one member per point)
+# "run" is headless: it never imports pygame or requests and steps the World as fast as it can
+# "view" steps the World in a worker process and draws the snapshots it publishes to shared memory
+import argparse
+import csv
+import queue
+import sys
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import main
+from main import World, EnvironmentBuilder, CollisionHandler, Integrator, FORCE_BACKENDS, INTEGRATORS, total_energy
+from snapshots import SnapshotRing, SnapshotView
+from trails import Trails, trail_capacity, trail_interval
+from ephemeris import ChebyshevEphemeris
+from checkpoint import save_checkpoint, load_checkpoint
+from diagnostics import Diagnostics, diagnostics_interval
+from ensemble import Ensemble, run_ensemble, sweep, PARAMETERS, ALIASES
+from trajectory import TrajectoryWriter, Trajectory, TrajectoryView, trajectory_interval
+from events import Events, Output, EVENTS
+from stats import Stats, stats_interval
+
+UNITS = {"s": 1.0, "m": 60.0, "h": 3600.0, "d": 86400.0, "y": 365.25 * 86400.0}
+SCENARIOS = ("solar_system", "horizons", "momentum_test")
+
+
+def duration(text): # "3600", "12h", "30d", "1.5y" -> seconds
+    text = text.strip()
+    if text and text[-1] in UNITS:
+        return float(text[:-1]) * UNITS[text[-1]]
+    return float(text)
+
+
+def drift(energy, energy_i): # relative energy error, absolute when the reference energy is zero
+    return abs(energy - energy_i) / abs(energy_i) if energy_i else abs(energy - energy_i)
+
+
+def build_world(args):
+    force_calculator = FORCE_BACKENDS[getattr(args, "backend", main.force_backend)](G=main.G, mass_threshold=main.mass_threshold)
+    integrator = Integrator(force_calculator, args.dt, method=getattr(args, "integrator", main.integrator_method))
+    world = World(integrator, force_calculator, EnvironmentBuilder(), CollisionHandler())
+    if getattr(args, "restart", None):
+        return world # run() fills it from the checkpoint
+    world.load_environment(args.scenario, **({"epoch": args.epoch} if args.scenario == "horizons" else {}))
+    if getattr(args, "ephemeris", None):
+        world.prescribe(ChebyshevEphemeris.load(args.ephemeris))
+        check_span(args, world)
+    return world
+
+
+def check_span(args, world): # --end against the ephemeris the massive bodies follow, before any step is taken
+    ephemeris = world.integrator.ephemeris
+    if ephemeris is None:
+        return
+    if not np.isfinite(args.end):
+        args.end = ephemeris.t_end # e.g. view without --end: stop where the ephemeris does
+    elif args.end > ephemeris.t_end:
+        sys.exit(f"astro_engine {args.command}: --end {args.end / 86400:g} d is past the end of the ephemeris at "
+                 f"{ephemeris.t_end / 86400:g} d")
+
+
+def event_spec(text): # "approach:AsteroidX:Earth", "crossing:Mercury:Sun", "output:30d:Earth:Moon" -> an Event
+    kind, *names = text.split(":")
+    if kind not in EVENTS:
+        raise argparse.ArgumentTypeError(f"events are {', '.join(EVENTS)}, not {kind}")
+    if kind == "output":
+        if len(names) < 2:
+            raise argparse.ArgumentTypeError("output:<interval>:<body>[:<body>...]")
+        return Output(*names[1:], interval=duration(names[0]))
+    return EVENTS[kind](*names)
+
+
+def describe(record): # one printed line per located event
+    extra = "  ".join(f"{key} {value:.6e}" if isinstance(value, float) else f"{key} {value}"
+                      for key, value in record.items() if key not in ("time", "kind", "label", "bodies"))
+    return f"t {record['time'] / 86400:12.6f} d  {record['label']}  {extra}"
+
+
+def write_rows(writer, world): # one row per body at the current time
+    t = world.integrator.time
+    for body in world.objects:
+        writer.writerow([f"{t:.6f}", body.name, *(f"{v:.10e}" for v in body.pos), *(f"{v:.10e}" for v in body.vel)])
+
+
+def run(args):
+    world = build_world(args)
+    integrator = world.integrator
+    step = world.step # bound once, the loop below does nothing else per step
+    extra = load_checkpoint(world, args.restart) if args.restart else {}
+    if args.restart:
+        check_span(args, world)
+    energy_i = extra.get("energy_i", total_energy(world.state.bodies)) # drift stays relative to the original start
+
+    out = open(args.out, "w", newline="") if args.out else None
+    writer = csv.writer(out) if out else None
+    if writer:
+        writer.writerow(["time", "name", "x", "y", "z", "vx", "vy", "vz"])
+        write_rows(writer, world)
+
+    trajectory = TrajectoryWriter(args.trajectory, args.trajectory_every, resume=integrator.time if args.restart else None) \
+        if args.trajectory else None
+    if trajectory:
+        trajectory.record(integrator.time, world)
+    if args.diagnostics:
+        world.diagnostics = Diagnostics(world.force_calculator, args.diagnostics_every, args.diagnostics,
+                                        resume=integrator.time if args.restart else None, reference=extra.get("diagnostics_reference"))
+        world.diagnostics.record(integrator.time, world.state, integrator.steps)
+    if args.event:
+        world.events = Events(args.event, out=args.events, resume=integrator.time if args.restart else None)
+    shown = 0 # events printed so far
+
+    def checkpoint(): # with what a restart needs to keep measuring drift from the original start
+        saved = {"energy_i": energy_i}
+        if world.diagnostics and world.diagnostics.reference is not None:
+            saved["diagnostics_reference"] = world.diagnostics.packed_reference()
+        save_checkpoint(world, args.checkpoint, **saved)
+    stats = Stats(args.stats_every, sys.stdout if args.stats == "-" else args.stats) if args.stats else None
+    world.instrument(stats)
+
+    def after(interval): # first multiple of interval past the current time, so a restart keeps the original cadence
+        return interval * (np.floor(integrator.time / interval) + 1) if interval else np.inf
+
+    every = args.every if args.every else np.inf
+    next_output = after(every)
+    next_checkpoint = after(args.checkpoint_every) if args.checkpoint else np.inf
+    t0 = time.perf_counter()
+    try:
+        while integrator.time < args.end:
+            step()
+            if stats:
+                stats.mark() # everything from here to the end of the iteration is output
+            if world.events and len(world.events.log) > shown:
+                for record in world.events.log[shown:]:
+                    if record["kind"] != "output": # scheduled outputs only go to --events
+                        print(describe(record), flush=True)
+                shown = len(world.events.log)
+            if trajectory:
+                trajectory.record(integrator.time, world)
+            if integrator.time >= next_checkpoint:
+                next_checkpoint = after(args.checkpoint_every)
+                checkpoint()
+            if integrator.time >= next_output:
+                next_output = after(every) # skip outputs a long step jumped over
+                energy = total_energy(world.state.bodies)
+                print(f"t {integrator.time / 86400:12.3f} d  steps {integrator.steps:10d}  dt {integrator.dt:10.3e} s  "
+                      f"bodies {len(world.state):6d} + {len(world.tests):7d} test  "
+                      f"energy error {drift(energy, energy_i):.2e}", flush=True)
+                if writer:
+                    write_rows(writer, world)
+            if stats:
+                stats.lap("io")
+    except KeyboardInterrupt:
+        print(f"interrupted at t {integrator.time / 86400:.3f} d", flush=True)
+    finally: # a kill between steps still leaves a checkpoint and the trajectory so far
+        if args.checkpoint:
+            checkpoint()
+        if trajectory:
+            trajectory.close()
+        if world.diagnostics:
+            world.diagnostics.close()
+        if world.events:
+            world.events.close()
+        if stats:
+            stats.report()
+            stats.close()
+    wall = time.perf_counter() - t0
+
+    if writer:
+        write_rows(writer, world)
+        out.close()
+    energy_f = total_energy(world.state.bodies)
+    print(f"done: {integrator.time / 86400:.3f} d in {integrator.steps} steps, {integrator.force_evals} force passes, "
+          f"{wall:.2f} s wall; energy error of the massive bodies {drift(energy_f, energy_i):.2e}")
+    if world.diagnostics:
+        worst = world.diagnostics.worst()
+        print(f"worst of {len(world.diagnostics.rows)} samples: energy {worst['energy_error']:.2e}, momentum {worst['momentum_error']:.2e}, "
+              f"angular momentum {worst['angular_momentum_error']:.2e}, centre of mass {worst['com_drift']:.3e} m off its line")
+    if stats:
+        share = stats.snapshot()["share"]
+        print("wall time: " + ", ".join(f"{phase} {share[phase]:.1%}" for phase in share if share[phase] >= .0005))
+
+
+def fit_ephemeris(args): # integrate the scenario's massive bodies once and save their Chebyshev fit
+    world = build_world(args)
+    t0 = time.perf_counter()
+    ephemeris = ChebyshevEphemeris.from_world(world, args.end)
+    ephemeris.save(args.out)
+    misfit, name = ephemeris.residual
+    print(f"{len(ephemeris.names)} bodies, {len(ephemeris.coef)} segments of {ephemeris.span / 86400:g} d "
+          f"to {args.out} in {time.perf_counter() - t0:.1f} s; worst fit residual {misfit:.3g} m ({name})")
+
+
+def simulate(args, ring_name, trail_name, trail_rows, layouts, commands, reports): # worker process: steps the World, publishes snapshots, obeys commands
+    world = build_world(args)
+    stats = Stats(interval=.5) # its report() goes to the viewer's overlay instead of a log
+    world.instrument(stats)
+    integrator = world.integrator
+    step = world.step
+    ring = SnapshotRing(0, name=ring_name)
+    trail_memory = shared_memory.SharedMemory(name=trail_name)
+    world.trails = Trails(trail_rows, interval=args.trail_every, buffer=trail_memory.buf) # written here, drawn by the viewer
+    interval = 1 / args.publish_rate
+    next_publish = 0.0
+    layout = -1
+    counts = None
+    paused = False
+
+    while True:
+        if not paused and integrator.time < args.end:
+            step()
+        now = time.perf_counter()
+        if now < next_publish:
+            continue
+        next_publish = now + interval
+        stats.mark()
+
+        if counts != (len(world.state), len(world.tests)): # merges and absorptions only ever shrink the body list
+            counts = (len(world.state), len(world.tests))
+            layout += 1
+            layouts.put((layout, [body.name for body in world.objects], [body.color for body in world.objects]))
+        ring.publish(integrator.time, layout, np.concatenate([world.state.pos, world.tests.pos]),
+                     np.concatenate([world.state.mass, world.tests.mass]), np.concatenate([world.state.radius, world.tests.radius]))
+        stats.lap("io")
+        if now >= stats.next_report:
+            reports.put(stats.report())
+
+        try:
+            while True:
+                command = commands.get_nowait()
+                if command == "stop":
+                    ring.close()
+                    world.trails = None # drop the views before closing the block they point into
+                    trail_memory.close()
+                    return
+                paused = command == "pause"
+        except queue.Empty:
+            pass
+        if paused or integrator.time >= args.end:
+            time.sleep(interval) # idle without spinning
+
+
+def view(args): # the pygame viewer at its own frame rate, fed by a simulation worker
+    from render import PygameRenderer
+
+    sizing = build_world(args) # bodies are never added mid-run, so the first counts are the most
+    ring = SnapshotRing(len(sizing.objects))
+    trail_rows = len(sizing.state) # trails follow the massive bodies, which come first in every snapshot
+    trail_memory = shared_memory.SharedMemory(create=True, size=Trails.size(trail_rows, trail_capacity))
+    trails = Trails(trail_rows, buffer=trail_memory.buf)
+
+    context = mp.get_context("spawn") # a clean interpreter; forking a process that holds a pygame display is unsafe
+    layouts = context.Queue()
+    commands = context.Queue() # "pause", "resume", "stop"
+    reports = context.Queue() # Stats.snapshot() dicts for the overlay
+    worker = context.Process(target=simulate, args=(args, ring.name, trail_memory.name, trail_rows, layouts, commands, reports), daemon=True)
+    worker.start()
+
+    snapshot = SnapshotView(ring)
+    renderer = PygameRenderer(main.scale)
+    frames = Stats() # the viewer's own render time; the worker's reports cover everything else
+    paused = False
+    running = True
+    while running:
+        running = renderer.handle_events(snapshot.objects)
+        if renderer.paused != paused:
+            paused = renderer.paused
+            commands.put("pause" if paused else "resume")
+
+        try:
+            while True:
+                layout, names, colors = layouts.get_nowait()
+                snapshot.layouts[layout] = (names, colors)
+        except queue.Empty:
+            pass
+        try:
+            while True:
+                report = reports.get_nowait()
+                report["seconds"]["render"] = frames.seconds["render"]
+                report["share"]["render"] = frames.snapshot()["share"]["render"] # of the viewer's wall time, not the worker's
+                renderer.stats = report
+        except queue.Empty:
+            pass
+
+        previous = snapshot.layout
+        if snapshot.refresh():
+            if snapshot.layout != previous:
+                retrack(renderer, snapshot.objects)
+            renderer.draw(snapshot.objects, snapshot.time, (snapshot.pos, snapshot.mass, snapshot.radius), trails) # ticks the clock at 60 FPS
+            frames.add("render", renderer.draw_seconds)
+        else:
+            renderer.clock.tick(60)
+
+    commands.put("stop")
+    worker.join(timeout=5)
+    if worker.is_alive():
+        worker.terminate()
+    renderer.quit()
+    ring.close()
+    del trails
+    trail_memory.close()
+    trail_memory.unlink()
+
+
+def retrack(renderer, objects): # follow the tracked body into a new body list
+    if renderer.tracked_object is not None:
+        name = renderer.tracked_object.name
+        renderer.tracked_object = next((body for body in objects if body.name == name), None)
+
+
+def replay(args): # a recorded --trajectory in the viewer; no physics, and only the samples around drawn frames are read
+    from render import PygameRenderer
+
+    trajectory = Trajectory(args.trajectory)
+    if not len(trajectory):
+        sys.exit(f"astro_engine replay: {args.trajectory} holds no samples")
+    playback = TrajectoryView(trajectory)
+    start, end = trajectory.times[0], trajectory.times[-1]
+    renderer = PygameRenderer(main.scale)
+    renderer.timeline = (start, end)
+    renderer.speed = args.speed if args.speed else (end - start) / 60 # the whole recording in a minute
+    t = start
+    last = time.perf_counter()
+    running = True
+    while running:
+        running = renderer.handle_events(playback.objects)
+        now = time.perf_counter()
+        if renderer.seek_to is not None:
+            t, renderer.seek_to = renderer.seek_to, None
+        elif not renderer.paused:
+            t = min(max(t + renderer.speed * (now - last), start), end)
+        last = now
+
+        if t != playback.time or playback.layout is None:
+            previous = playback.layout
+            playback.seek(t)
+            if playback.layout != previous:
+                retrack(renderer, playback.objects)
+        renderer.draw(playback.objects, t, (playback.pos, playback.mass, playback.radius)) # ticks the clock at 60 FPS
+    renderer.quit()
+
+
+def sweep_values(text): # "tolerance=.05,.1,.2" -> ("tolerance", [.05, .1, .2])
+    name, _, values = text.partition("=")
+    name = ALIASES.get(name.strip(), name.strip())
+    if name not in PARAMETERS:
+        raise argparse.ArgumentTypeError(f"can sweep {', '.join(PARAMETERS)}, not {name}")
+    return name, [duration(v) if name.endswith("dt") else float(v) for v in values.split(",")]
+
+
+def ensemble(args): # many variants of one scenario stepped together, with a summary row per member
+    world = build_world(args)
+    params, members = sweep(args.members, **dict(args.sweep))
+    params.setdefault("dt", args.dt)
+    batch = Ensemble.from_world(world, members, params, probe=args.probe, target=args.target)
+    if args.perturb:
+        batch.perturb(args.perturb, args.sigma_pos, args.sigma_vel, args.seed)
+
+    t0 = time.perf_counter()
+    summary = run_ensemble(batch, args.end, args.processes)
+    wall = time.perf_counter() - t0
+
+    hits = summary["impact_body"][summary["impact"]]
+    print(f"{members} members to {args.end / 86400:.1f} d in {wall:.1f} s ({summary['steps'].sum()} member steps)")
+    for body, count in zip(*np.unique(hits, return_counts=True)):
+        print(f"  {args.probe} hit {batch.names[body]}: {count} of {members} ({count / members:.1%})")
+    print(f"  closest approach to {args.target}: {summary['min_distance'].min():.4e} m, median {np.median(summary['min_distance']):.4e} m")
+    print(f"  energy error: median {np.median(summary['energy_error']):.2e}, worst {summary['energy_error'].max():.2e}")
+
+    if args.out:
+        swept = [name for name, _ in args.sweep]
+        with open(args.out, "w", newline="") as out:
+            writer = csv.writer(out)
+            writer.writerow(["member", *swept, "impact", "impact_body", "impact_time", "min_distance", "min_distance_time",
+                             "energy_error", "steps"])
+            for k in range(members):
+                body = summary["impact_body"][k]
+                writer.writerow([k, *(summary[name][k] for name in swept), int(summary["impact"][k]), batch.names[body] if body >= 0 else "",
+                                 summary["impact_time"][k], summary["min_distance"][k], summary["min_distance_time"][k],
+                                 summary["energy_error"][k], summary["steps"][k]])
+
+
+def parser():
+    p = argparse.ArgumentParser(prog="astro_engine")
+    commands = p.add_subparsers(dest="command", required=True)
+    for name, fn, help_text in (("run", run, "integrate without a display"), ("view", view, "integrate in the pygame viewer"),
+                                ("ephemeris", fit_ephemeris, "fit an ephemeris of the massive bodies for --ephemeris")):
+        c = commands.add_parser(name, help=help_text)
+        c.set_defaults(fn=fn)
+        c.add_argument("--scenario", choices=SCENARIOS, default="solar_system")
+        c.add_argument("--epoch", default="2025-08-12", help="date for --scenario horizons, yyyy-mm-dd")
+        c.add_argument("--end", type=duration, default=np.inf, help="simulated time to stop at, e.g. 3600, 30d, 10y")
+        c.add_argument("--integrator", choices=sorted(INTEGRATORS), default=main.integrator_method)
+        c.add_argument("--dt", type=duration, default=main.dt, help="initial (or fixed) step")
+        c.add_argument("--backend", choices=sorted(FORCE_BACKENDS), default=main.force_backend)
+        if name != "ephemeris":
+            c.add_argument("--ephemeris", default=None, help="saved ephemeris the massive bodies follow; --dt is then the fixed outer step")
+        if name == "run":
+            c.add_argument("--every", type=duration, default=None, help="simulated time between progress lines and output rows")
+            c.add_argument("--out", default=None, help="CSV of time, name, position and velocity at each output")
+            c.add_argument("--checkpoint", default=None, help="file the whole World is saved to, atomically, every --checkpoint-every and at exit")
+            c.add_argument("--checkpoint-every", type=duration, default=365.25 * 86400.0, help="simulated time between checkpoints")
+            c.add_argument("--restart", default=None, help="checkpoint to continue from; the scenario, integrator and dt come from it")
+            c.add_argument("--trajectory", default=None, help="directory of memory-mappable chunks the sampled states stream into")
+            c.add_argument("--trajectory-every", type=duration, default=trajectory_interval, help="simulated time between trajectory samples")
+            c.add_argument("--diagnostics", default=None, help="CSV time series of energy, momentum, angular momentum and their drift")
+            c.add_argument("--diagnostics-every", type=duration, default=diagnostics_interval, help="simulated time between diagnostics samples")
+            c.add_argument("--event", type=event_spec, action="append", default=[],
+                           help=f"kind:body:body, kind one of {', '.join(EVENTS)}; output:<interval>:<body>... for fixed times; repeatable")
+            c.add_argument("--events", default=None, help="JSON Lines file every located event is appended to, in time order")
+            c.add_argument("--stats", default=None, help="JSON Lines file (- for stdout) of per-phase timings, counters and step sizes")
+            c.add_argument("--stats-every", type=float, default=stats_interval, help="wall-clock seconds between --stats lines")
+        elif name == "ephemeris":
+            c.add_argument("--out", required=True, help="where to save the fitted ephemeris (.npz)")
+        else:
+            c.add_argument("--publish-rate", type=float, default=120.0, help="snapshots per wall-clock second from the worker")
+            c.add_argument("--trail-every", type=duration, default=trail_interval, help="simulated time between orbit trail samples")
+
+    c = commands.add_parser("replay", help="play back a recorded --trajectory")
+    c.set_defaults(fn=replay)
+    c.add_argument("trajectory", help="directory written by run --trajectory")
+    c.add_argument("--speed", type=duration, default=None, help="simulated time per wall-clock second, e.g. 30d; the whole recording in a minute by default")
+
+    c = commands.add_parser("ensemble", help="run many perturbed or parameter-swept copies of a scenario together")
+    c.set_defaults(fn=ensemble)
+    c.add_argument("--scenario", choices=SCENARIOS, default="solar_system")
+    c.add_argument("--epoch", default="2025-08-12", help="date for --scenario horizons, yyyy-mm-dd")
+    c.add_argument("--end", type=duration, required=True, help="simulated time every member runs to")
+    c.add_argument("--dt", type=duration, default=main.dt, help="initial step of every member (velocity Verlet, adaptive dt)")
+    c.add_argument("--members", type=int, default=1, help="members per sweep point")
+    c.add_argument("--sweep", type=sweep_values, action="append", default=[], help=f"name=v1,v2,... for any of {', '.join(PARAMETERS)}; repeat for a grid")
+    c.add_argument("--perturb", default=None, help="body whose initial state is scattered; member 0 stays nominal")
+    c.add_argument("--sigma-pos", type=float, default=0.0, help="position scatter per axis, metres")
+    c.add_argument("--sigma-vel", type=float, default=0.0, help="velocity scatter per axis, m/s")
+    c.add_argument("--seed", type=int, default=0)
+    c.add_argument("--probe", default="AsteroidX", help="body whose impacts are reported")
+    c.add_argument("--target", default="Earth", help="body whose closest approach to the probe is reported")
+    c.add_argument("--processes", type=int, default=None, help="worker processes for the shards; 1 runs in this process")
+    c.add_argument("--out", default=None, help="CSV with one summary row per member")
+    return p
+
+
+if __name__ == "__main__":
+    args = parser().parse_args()
+    if args.command in ("run", "ephemeris") and not np.isfinite(args.end):
+        sys.exit(f"astro_engine {args.command}: --end is required")
+    args.fn(args)
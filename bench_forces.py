@@ -0,0 +1,118 @@
+# FORCE KERNEL BENCHMARK
+# per-object ForceCalculator.accel_calc loop vs the batched accelerations() kernel, the Barnes-Hut backend, test particles
+# and strong scaling of the parallel backend
+import os
+import time
+import numpy as np
+from main import G, mass_threshold, ForceCalculator, TreeForceCalculator, ParallelForceCalculator, EnvironmentBuilder, ParticleState, CelestialBody
+
+AU = 1.496e11
+
+
+def solar_state():
+    environment_builder = EnvironmentBuilder()
+    environment_builder.solar_system()
+    state = ParticleState()
+    state.add(environment_builder.objects)
+    return state
+
+
+def random_state(n, seed=0): # n massive bodies scattered through a 10 AU cube
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(-5 * AU, 5 * AU, (n, 3))
+    vel = rng.normal(0, 1e4, (n, 3))
+    mass = 10 ** rng.uniform(21, 25, n)
+    bodies = [CelestialBody(f"b{i}", "#AAAAAA", *pos[i], *vel[i], mass[i], 1e6) for i in range(n)]
+    state = ParticleState()
+    state.add(bodies)
+    return state
+
+
+def best_time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def bench(label, state, sample, repeats):
+    force_calc = ForceCalculator(G=G, mass_threshold=mass_threshold)
+    objects = state.bodies
+    targets = objects[:sample] # the per-object loop is timed on a sample and scaled up to all N
+
+    t_loop = best_time(lambda: [force_calc.accel_calc(o, objects) for o in targets], repeats) * len(objects) / len(targets)
+    t_batch = best_time(lambda: force_calc.accelerations(state), repeats)
+
+    reference = np.array([force_calc.accel_calc(o, objects) for o in targets])
+    batched = force_calc.accelerations(state)[:len(targets)]
+    rel_err = np.max(np.linalg.norm(batched - reference, axis=1) / np.linalg.norm(reference, axis=1))
+
+    print(f"{label:>13}  N={len(objects):>6}  loop {t_loop:10.4f} s  batched {t_batch:9.5f} s  "
+          f"speedup {t_loop / t_batch:9.1f}x  max rel err {rel_err:.1e}")
+
+
+def bench_tree(label, state, theta, t_direct=None):
+    tree_calc = TreeForceCalculator(G=G, mass_threshold=mass_threshold, theta=theta)
+    t0 = time.perf_counter()
+    tree_calc.accelerations(state)
+    t_tree = time.perf_counter() - t0
+    if t_direct is None:
+        t_direct = best_time(lambda: ForceCalculator(G=G, mass_threshold=mass_threshold).accelerations(state), 1)
+    err = tree_calc.force_error(state, sample=500)
+
+    print(f"{label:>13}  N={len(state):>6}  θ={theta:.2f}  direct {t_direct:9.3f} s  tree {t_tree:8.3f} s  "
+          f"interactions/body {tree_calc.tree.interactions / len(state):6.0f}  "
+          f"rel err median {err['median']:.1e} p99 {err['p99']:.1e}")
+    return t_direct
+
+
+def bench_test_particles(n_test, seed=0): # massive solar system acting on n_test massless bodies
+    rng = np.random.default_rng(seed)
+    state = solar_state()
+    massive = state.subset(np.flatnonzero(state.mass >= mass_threshold))
+    tests = ParticleState()
+    t_add = best_time(lambda: tests.add_arrays(rng.uniform(-30 * AU, 30 * AU, (n_test, 3)), rng.normal(0, 1e4, (n_test, 3))), 1)
+    force_calc = ForceCalculator(G=G, mass_threshold=mass_threshold)
+    t_field = best_time(lambda: force_calc.field_at(tests.pos, massive), 3)
+    sample = random_state(2000)
+    t_n2 = best_time(lambda: force_calc.accelerations(sample), 1) * ((len(massive) + n_test) / 2000)**2 # every body in the pairwise kernel
+
+    print(f"{'test':>13}  N={len(massive):>3} + {n_test:>7}  add {t_add:7.3f} s  field {t_field:8.4f} s  "
+          f"pairwise (scaled) {t_n2:10.1f} s")
+
+
+def bench_parallel(n, repeats=3): # strong scaling: the same N on 1, 2, 4, ... workers up to every core
+    state = random_state(n)
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    t_direct = best_time(lambda: ForceCalculator(G=G, mass_threshold=mass_threshold).accelerations(state), repeats)
+    counts = sorted({2**i for i in range(cores.bit_length()) if 2**i <= cores} | {cores})
+    t_one = None
+    for workers in counts:
+        force_calc = ParallelForceCalculator(G=G, mass_threshold=mass_threshold, workers=workers)
+        force_calc.accelerations(state) # warm the pool
+        t = best_time(lambda: force_calc.accelerations(state), repeats)
+        t_one = t_one or t
+        print(f"{'parallel':>13}  N={n:>6}  workers {workers:>3}/{cores}  {t:9.4f} s  speedup {t_one / t:5.2f}x  "
+              f"efficiency {t_one / t / workers:5.0%}  vs direct {t_direct / t:5.2f}x")
+        force_calc.pool.shutdown()
+
+
+if __name__ == "__main__":
+    bench("solar_system", solar_state(), sample=13, repeats=20)
+    bench("1k", random_state(1000), sample=50, repeats=3)
+    bench("10k", random_state(10000), sample=5, repeats=1)
+
+    # Barnes-Hut backend; the 100k direct time is scaled from the 10k run as N^2
+    t_10k = bench_tree("tree 10k", random_state(10000), theta=.5)
+    bench_tree("tree 10k", random_state(10000), theta=.8, t_direct=t_10k)
+    bench_tree("tree 100k", random_state(100000), theta=.5, t_direct=t_10k * 100)
+
+    # test particles: O(N_massive x N_test) instead of O((N_massive + N_test)^2)
+    bench_test_particles(100000)
+    bench_test_particles(1000000)
+
+    # parallel backend: twice the pair work of the symmetric serial kernel, split over the cores
+    bench_parallel(10000)
+    bench_parallel(30000, repeats=1)
@@ -0,0 +1,85 @@
+# IMPORTS
+import numpy as np
+from octree import _ranges
+
+
+def sweep_and_prune(lo, hi): # (i, j) pairs, i < j, whose boxes [lo, hi] overlap on every axis
+    # sort along x; a box can only meet the ones that start before it ends, so each body is paired
+    # with a contiguous run of the sorted list instead of with everyone
+    n = len(lo)
+    order = np.argsort(lo[:, 0], kind='stable')
+    lo_s = lo[order]
+    hi_s = hi[order]
+
+    reach = np.searchsorted(lo_s[:, 0], hi_s[:, 0], side='right') # first sorted box starting past this one's end
+    counts = reach - np.arange(n) - 1
+    a = np.repeat(np.arange(n), counts)
+    b = _ranges(np.arange(1, n + 1), counts)
+
+    overlap = np.all((lo_s[b] <= hi_s[a]) & (lo_s[a] <= hi_s[b]), axis=1) # x overlaps by construction, y and z may not
+    i = order[a[overlap]]
+    j = order[b[overlap]]
+    return np.minimum(i, j), np.maximum(i, j)
+
+
+def swept_boxes(p0, p1, radius): # boxes around each sphere's path from p0 to p1
+    return np.minimum(p0, p1) - radius[:, None], np.maximum(p0, p1) + radius[:, None]
+
+
+def swept_contact(d0, d1, reach): # separations at the start and end of a step -> True where they come within reach on the way
+    # relative motion is taken as linear across the step, so bodies that pass through each other between
+    # two snapshots are still caught
+    dd = d1 - d0
+    dd2 = np.einsum('ij,ij->i', dd, dd)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.clip(-np.einsum('ij,ij->i', d0, dd) / dd2, 0.0, 1.0)
+    s[dd2 == 0] = 0.0
+    closest = d0 + s[:, None] * dd
+    return np.einsum('ij,ij->i', closest, closest) <= reach**2
+
+
+def hermite_boxes(p0, v0, p1, v1, h, radius): # boxes around each sphere's cubic Hermite path across a step of length h
+    # the curve stays inside the hull of its Bezier control points, so a box around those four holds all of it
+    c1 = p0 + v0 * (h / 3)
+    c2 = p1 - v1 * (h / 3)
+    lo = np.minimum(np.minimum(p0, p1), np.minimum(c1, c2))
+    hi = np.maximum(np.maximum(p0, p1), np.maximum(c1, c2))
+    return lo - radius[:, None], hi + radius[:, None]
+
+
+def hermite_contact(d0, u0, d1, u1, h, reach, samples=16, iterations=30): # True where the separation comes within reach on the way
+    # d, u: separations and relative velocities at the two ends of an interval of length h (scalar or per row). The
+    # relative motion is the cubic Hermite between them, so a hairpin pass whose straight chord cuts through a body is
+    # followed round the curve; the distance is sampled, then its smallest sample refined by golden-section search
+    h = np.broadcast_to(np.asarray(h, dtype=float), (len(d0),))[:, None]
+    reach2 = np.broadcast_to(np.asarray(reach, dtype=float), (len(d0),))**2
+    # d(s) = d0 + b s + c s^2 + e s^3 for s in [0, 1], one row per pair
+    coefficients = np.stack([d0, h * u0, 3 * (d1 - d0) - 2 * h * u0 - h * u1, 2 * (d0 - d1) + h * (u0 + u1)], axis=1)
+
+    def dist2(coefficients, s): # (rows, 4, 3) and s (rows, k) -> squared separations (rows, k)
+        a, b, c, e = (coefficients[:, None, n] for n in range(4))
+        s = s[..., None]
+        d = a + s * (b + s * (c + s * e))
+        return np.einsum('...c,...c->...', d, d)
+
+    grid = np.linspace(0.0, 1.0, samples + 1)
+    sampled = dist2(coefficients, np.broadcast_to(grid, (len(d0), samples + 1)))
+    hit = sampled.min(axis=1) <= reach2
+    rows = np.flatnonzero(~hit)
+    if len(rows) == 0:
+        return hit
+
+    coefficients = coefficients[rows]
+    k = np.argmin(sampled[rows], axis=1)
+    lo = grid[np.maximum(k - 1, 0)]
+    hi = grid[np.minimum(k + 1, samples)]
+    ratio = (np.sqrt(5) - 1) / 2
+    for _ in range(iterations): # the closest sample's neighbours bracket the minimum
+        m1 = hi - ratio * (hi - lo)
+        m2 = lo + ratio * (hi - lo)
+        f = dist2(coefficients, np.stack([m1, m2], axis=1))
+        closer = f[:, 0] < f[:, 1]
+        hi = np.where(closer, m2, hi)
+        lo = np.where(closer, lo, m1)
+    hit[rows] = dist2(coefficients, (.5 * (lo + hi))[:, None])[:, 0] <= reach2[rows]
+    return hit
@@ -0,0 +1,78 @@
+# IMPORTS
+import os
+import numpy as np
+from main import ParticleState, CelestialBody
+from ephemeris import ChebyshevEphemeris
+
+# CONSTANTS/SETTINGS
+CHECKPOINT_VERSION = 3
+# Integrator attributes a restart needs to take exactly the same steps; F_prev is the adaptive_dt history
+INTEGRATOR_FIELDS = ("dt", "test_dt", "encounter_dt", "time", "steps", "force_evals", "body_evals", "F_prev")
+
+
+# CHECKPOINT
+def save_checkpoint(world, path, **extra): # the whole World in one .npz, replaced atomically so a kill never leaves half a file
+    # extra holds scalars or arrays the caller wants back on restart, e.g. the initial energy
+    integrator = world.integrator
+    arrays = {"version": CHECKPOINT_VERSION, "method": integrator.method}
+    for field in INTEGRATOR_FIELDS:
+        arrays[f"integrator.{field}"] = getattr(integrator, field)
+
+    for group in ("state", "tests"):
+        state = getattr(world, group)
+        for column in state.columns:
+            arrays[f"{group}.{column}"] = getattr(state, column)
+        arrays[f"{group}.acc_valid"] = state.acc_valid
+        arrays[f"{group}.name"] = np.array([body.name for body in state.bodies], dtype=str)
+        arrays[f"{group}.color"] = np.array([body.color for body in state.bodies], dtype=str)
+        arrays[f"{group}.method"] = np.array([body.method or "" for body in state.bodies], dtype=str)
+
+    if integrator._kick_cache is not None: # Wisdom-Holman reuses its last kick, a restart must too
+        for key, value in zip(("pos", "mass", "acc"), integrator._kick_cache):
+            arrays[f"kick.{key}"] = value
+    if integrator._test_sources is not None: # likewise the test particles' closing field
+        arrays["test_sources.pos"], arrays["test_sources.mass"] = integrator._test_sources
+    if integrator._changeover is not None: # mercury's critical distances stay those of the original bodies
+        arrays["changeover.mass"], arrays["changeover.r_crit"] = integrator._changeover
+    ephemeris = integrator.ephemeris
+    if ephemeris is not None:
+        arrays.update({"ephemeris.names": np.array(ephemeris.names, dtype=str), "ephemeris.t_start": ephemeris.t_start,
+                       "ephemeris.span": ephemeris.span, "ephemeris.coef": ephemeris.coef})
+    for key, value in extra.items():
+        arrays[f"extra.{key}"] = value
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno()) # on disk before it replaces the previous checkpoint
+    os.replace(tmp, path)
+
+
+def load_checkpoint(world, path): # puts a saved World back in place of world's bodies and integrator state; returns the extras
+    with np.load(path) as f:
+        if int(f["version"]) != CHECKPOINT_VERSION:
+            raise ValueError(f"{path}: checkpoint version {int(f['version'])}, expected {CHECKPOINT_VERSION}")
+        integrator = world.integrator
+        integrator.method = str(f["method"])
+        for field in INTEGRATOR_FIELDS:
+            value = f[f"integrator.{field}"]
+            setattr(integrator, field, value.copy() if value.ndim else value.item())
+
+        for group in ("state", "tests"):
+            state = ParticleState()
+            for column in state.columns:
+                setattr(state, column, f[f"{group}.{column}"].copy())
+            state.acc_valid = bool(f[f"{group}.acc_valid"])
+            state.bodies = [CelestialBody.view(state, i, str(name), str(color), str(method) or None)
+                            for i, (name, color, method) in enumerate(zip(f[f"{group}.name"], f[f"{group}.color"], f[f"{group}.method"]))]
+            setattr(world, group, state)
+
+        integrator._kick_cache = (f["kick.pos"].copy(), f["kick.mass"].copy(), f["kick.acc"].copy()) if "kick.pos" in f else None
+        integrator._test_sources = (f["test_sources.pos"].copy(), f["test_sources.mass"].copy()) if "test_sources.pos" in f else None
+        integrator._changeover = (f["changeover.mass"].copy(), f["changeover.r_crit"].copy()) if "changeover.mass" in f else None
+        integrator.ephemeris = None
+        if "ephemeris.coef" in f:
+            integrator.ephemeris = ChebyshevEphemeris(list(f["ephemeris.names"]), float(f["ephemeris.t_start"]),
+                                                      float(f["ephemeris.span"]), f["ephemeris.coef"].copy())
+        return {key[len("extra."):]: f[key].item() if f[key].ndim == 0 else f[key].copy() for key in f.files if key.startswith("extra.")}
@@ -0,0 +1,108 @@
+# IMPORTS
+import csv
+import os
+import numpy as np
+
+# CONSTANTS/SETTINGS
+diagnostics_interval = 10 * 86400.0 # simulated seconds between samples; one sample costs about half a direct force step
+COLUMNS = ("time", "steps", "bodies", "kinetic", "potential", "energy", "px", "py", "pz", "lx", "ly", "lz",
+           "cx", "cy", "cz", "energy_error", "momentum_error", "angular_momentum_error", "com_drift")
+# the parts of conserved() drift is measured against, in the order packed_reference() lays them out
+REFERENCE = ("kinetic", "potential", "energy", "momentum", "angular_momentum", "com", "com_vel", "momentum_scale", "angular_scale")
+
+
+# CONSERVED QUANTITIES
+def conserved(state, force_calc): # energies, momentum, angular momentum and centre of mass of a state, in one pass
+    # the potential comes from force_calc, so a tree backend gives tree-approximated potentials at tree cost
+    m = state.mass
+    M = m.sum()
+    kinetic = .5 * m @ np.einsum('ij,ij->i', state.vel, state.vel)
+    potential = .5 * m @ force_calc.potentials(state) if len(state) else 0.0 # each pair is in two bodies' potentials
+    momentum = m @ state.vel
+    angular = m @ np.cross(state.pos, state.vel)
+    return {
+        "kinetic": kinetic,
+        "potential": potential,
+        "energy": kinetic + potential,
+        "momentum": momentum,
+        "angular_momentum": angular,
+        "com": m @ state.pos / M if M else np.zeros(3),
+        "com_vel": momentum / M if M else np.zeros(3),
+        # natural sizes of P and L, so their errors stay meaningful when the totals themselves are near zero
+        "momentum_scale": m @ np.linalg.norm(state.vel, axis=1),
+        "angular_scale": m @ (np.linalg.norm(state.pos, axis=1) * np.linalg.norm(state.vel, axis=1)),
+    }
+
+
+# DIAGNOSTICS
+class Diagnostics: # time series of the conserved quantities and their drift from the first sample
+    def __init__(self, force_calc, interval=diagnostics_interval, out=None, resume=None, reference=None):
+        # out is an optional CSV path that every sample is appended to as it is taken; resume is the time of the
+        # checkpoint a run restarts from, and reference the packed_reference() saved with it, so the series and its
+        # drift columns carry on from the original start: rows of out up to resume are kept, later ones dropped
+        self.force_calc = force_calc
+        self.interval = interval
+        self.next_time = -np.inf
+        self.reference = None if reference is None else unpack_reference(reference) # (time, conserved()) of the first sample
+        self.rows = []
+        kept = []
+        if out and resume is not None and os.path.exists(out):
+            with open(out, newline="") as f:
+                kept = [row for row in list(csv.reader(f))[1:] if float(row[0]) <= resume]
+            self.rows = [tuple(float(v) for v in row) for row in kept]
+            if self.rows:
+                self.next_time = self.rows[-1][0] + self.interval # the cadence of the run being resumed
+        self.file = open(out, "w", newline="") if out else None
+        self.writer = csv.writer(self.file) if out else None
+        if self.writer:
+            self.writer.writerow(COLUMNS)
+            self.writer.writerows(kept) # as they were written
+            self.file.flush()
+
+    def record(self, t, state, steps=0): # called after every step; samples once per interval
+        if t < self.next_time:
+            return
+        self.next_time = t + self.interval
+        now = conserved(state, self.force_calc)
+        if self.reference is None:
+            self.reference = (t, now)
+        t0, ref = self.reference
+
+        energy_error = abs(now["energy"] - ref["energy"]) / abs(ref["energy"]) if ref["energy"] else abs(now["energy"])
+        momentum_error = np.linalg.norm(now["momentum"] - ref["momentum"]) / (ref["momentum_scale"] or 1.0)
+        angular_error = np.linalg.norm(now["angular_momentum"] - ref["angular_momentum"]) / (ref["angular_scale"] or 1.0)
+        com_drift = np.linalg.norm(now["com"] - ref["com"] - ref["com_vel"] * (t - t0)) # metres off the initial straight line
+
+        row = (t, steps, len(state), now["kinetic"], now["potential"], now["energy"], *now["momentum"],
+               *now["angular_momentum"], *now["com"], energy_error, momentum_error, angular_error, com_drift)
+        self.rows.append(row)
+        if self.writer:
+            self.writer.writerow([f"{v:.10e}" if isinstance(v, float) else v for v in row])
+            self.file.flush()
+
+    def packed_reference(self): # the reference as one flat array, for checkpoint extras
+        t0, ref = self.reference
+        return np.concatenate([[t0], *(np.atleast_1d(ref[key]) for key in REFERENCE)])
+
+    def series(self): # column name -> array over the samples
+        table = np.array(self.rows, dtype=float).reshape(-1, len(COLUMNS))
+        return {name: table[:, i] for i, name in enumerate(COLUMNS)}
+
+    def worst(self): # largest error of each kind so far
+        series = self.series()
+        return {name: series[name].max() if len(self.rows) else 0.0
+                for name in ("energy_error", "momentum_error", "angular_momentum_error", "com_drift")}
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def unpack_reference(packed): # inverse of Diagnostics.packed_reference
+    ref = {}
+    k = 1
+    for key in REFERENCE:
+        size = 3 if key in ("momentum", "angular_momentum", "com", "com_vel") else 1
+        ref[key] = packed[k:k + size].copy() if size == 3 else float(packed[k])
+        k += size
+    return float(packed[0]), ref
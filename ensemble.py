@@ -0,0 +1,235 @@
+# IMPORTS
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import main
+from broadphase import hermite_boxes, hermite_contact
+
+# CONSTANTS/SETTINGS
+# controller settings a member can override, with their main.py defaults; dt is the initial step
+PARAMETERS = {"dt": main.dt, "tolerance": main.tolerance, "α": main.α, "β": main.β, "safe_factor": main.safe_factor,
+              "min_dt": main.min_dt, "max_dt": main.max_dt}
+ALIASES = {"alpha": "α", "beta": "β"} # for command lines without Greek keys
+shard_size = 64 # members per worker task
+
+
+# ENSEMBLE
+class Ensemble: # K independent copies of one scene, every array with a leading member axis, stepped together
+    # each member runs main's velocity Verlet with the adaptive_dt controller on its own dt, so members that
+    # need small steps do not hold back the rest; bodies merge within their own member only
+    def __init__(self, names, pos, vel, mass, radius, params=None, G=main.G, mass_threshold=main.mass_threshold,
+                 probe=None, target=None):
+        # probe / target: names of the body whose impacts and distance to target are summarised per member
+        self.names = list(names)
+        self.pos = np.array(pos, dtype=float) # (K, N, 3)
+        self.vel = np.array(vel, dtype=float)
+        self.mass = np.array(mass, dtype=float) # (K, N)
+        self.radius = np.array(radius, dtype=float)
+        k = len(self.pos)
+        self.params = {name: np.broadcast_to(np.asarray((params or {}).get(name, default), dtype=float), k).copy()
+                       for name, default in PARAMETERS.items()}
+        self.G = G
+        self.mass_threshold = mass_threshold
+        self.probe = self.names.index(probe) if probe is not None else None
+        self.target = self.names.index(target) if target is not None else None
+
+        self.alive = np.ones(self.mass.shape, dtype=bool) # rows not yet absorbed by another body of their member
+        self.dt = self.params["dt"].copy()
+        self.time = np.zeros(k)
+        self.steps = np.zeros(k, dtype=np.int64)
+        self.acc = self.accelerations(self.pos, self.mass, self.alive)
+        self.energy_i = self.energy()
+        self.impact = np.full(k, -1) # body the probe hit, -1 while it has not
+        self.impact_time = np.full(k, np.nan)
+        self.min_distance = np.full(k, np.inf) # closest probe-target approach, along each step's straight line
+        self.min_distance_time = np.full(k, np.nan)
+        if self.probe is not None and self.target is not None:
+            self.min_distance = np.linalg.norm(self.pos[:, self.probe] - self.pos[:, self.target], axis=1)
+            self.min_distance_time = self.time.copy()
+
+    def __len__(self):
+        return len(self.pos)
+
+    @classmethod
+    def from_world(cls, world, members, params=None, probe=None, target=None): # members copies of world's bodies
+        objects = world.objects
+        tile = lambda values: np.repeat(np.asarray(values, dtype=float)[None], members, axis=0)
+        return cls([body.name for body in objects], tile([body.pos for body in objects]), tile([body.vel for body in objects]),
+                   tile([body.mass for body in objects]), tile([body.radius for body in objects]), params,
+                   world.force_calculator.G, world.force_calculator.mass_threshold, probe, target)
+
+    def perturb(self, name, sigma_pos, sigma_vel, seed=0, keep_first=True): # Gaussian scatter of one body's initial state
+        # keep_first leaves member 0 as the nominal case
+        i = self.names.index(name)
+        rng = np.random.default_rng(seed)
+        first = 1 if keep_first else 0
+        self.pos[first:, i] += rng.normal(scale=sigma_pos, size=(len(self) - first, 3))
+        self.vel[first:, i] += rng.normal(scale=sigma_vel, size=(len(self) - first, 3))
+        self.acc = self.accelerations(self.pos, self.mass, self.alive)
+        self.energy_i = self.energy()
+        if self.probe is not None and self.target is not None:
+            self.min_distance = np.linalg.norm(self.pos[:, self.probe] - self.pos[:, self.target], axis=1)
+
+    def split(self, size): # consecutive shards of at most size members, e.g. for a process pool
+        shards = []
+        for k0 in range(0, len(self), size):
+            shard = Ensemble.__new__(Ensemble)
+            for key, value in vars(self).items():
+                if isinstance(value, np.ndarray):
+                    value = value[k0:k0 + size].copy()
+                elif key == "params":
+                    value = {name: v[k0:k0 + size].copy() for name, v in value.items()}
+                setattr(shard, key, value)
+            shards.append(shard)
+        return shards
+
+    def accelerations(self, pos, mass, alive): # (K, N, 3) in one batched pass over every member's pairs
+        src_mass = np.where(alive & (mass >= self.mass_threshold), mass, 0.0)
+        d = pos[:, None, :, :] - pos[:, :, None, :] # [k, i, j] points from i towards j
+        r2 = np.einsum('kijc,kijc->kij', d, d)
+        r = np.sqrt(r2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = self.G * src_mass[:, None, :] / (r * (r2 + main.eps**2)) # same softening as ForceCalculator
+        w[r == 0] = 0.0
+        return np.einsum('kij,kijc->kic', w, d)
+
+    def energy(self): # energy of every member's massive bodies, as total_energy counts them in run
+        m = np.where(self.alive & (self.mass >= self.mass_threshold), self.mass, 0.0)
+        kinetic = .5 * np.einsum('kn,kn->k', m, np.einsum('knc,knc->kn', self.vel, self.vel))
+        d = self.pos[:, None, :, :] - self.pos[:, :, None, :]
+        r = np.sqrt(np.einsum('kijc,kijc->kij', d, d))
+        with np.errstate(divide='ignore'):
+            inv = np.where(r > 0, 1 / r, 0.0)
+        potential = -.5 * self.G * np.einsum('ki,kij,kj->k', m, inv, m)
+        return kinetic + potential
+
+    def step(self, end): # one step of every member still short of end
+        idx = np.flatnonzero(self.time < end) # fancy indexing: the start-of-step arrays below are copies
+        dt = self.dt[idx][:, None, None]
+        p0 = self.pos[idx]
+        v0 = self.vel[idx]
+        a0 = self.acc[idx]
+        alive = self.alive[idx]
+        live = alive[:, :, None]
+
+        # velocity_verlet, with absorbed rows frozen
+        pos = np.where(live, p0 + v0 * dt + .5 * a0 * dt * dt, p0)
+        a1 = self.accelerations(pos, self.mass[idx], alive)
+        vel = np.where(live, v0 + .5 * (a0 + a1) * dt, v0)
+        self.pos[idx] = pos
+        self.vel[idx] = vel
+        self.acc[idx] = a1
+        taken = self.dt[idx].copy()
+        self.steps[idx] += 1
+        self.time[idx] += taken
+
+        self.adaptive_dt(idx, a0, a1, alive)
+        self.track(idx, p0, pos, taken)
+        self.collisions(idx, p0, v0, pos, vel, taken)
+
+    def adaptive_dt(self, idx, a0, a1, alive): # Integrator.adaptive_dt per member, over its live bodies
+        p = {name: value[idx][:, None] for name, value in self.params.items()}
+        dt = self.dt[idx][:, None]
+        dF_rel = np.linalg.norm(a1 - a0, axis=2) / (np.linalg.norm(a1, axis=2) + main.eps)
+        with np.errstate(divide='ignore'):
+            dt_candidate = dt * (p["tolerance"] / dF_rel)**p["α"]
+        dt_smooth = (1 - p["β"]) * dt + p["β"] * p["safe_factor"] * dt_candidate
+        dt_smooth = np.where(alive, dt_smooth, np.inf)
+        dt_new = np.clip(dt_smooth.min(axis=1), p["min_dt"][:, 0], p["max_dt"][:, 0])
+        first = self.steps[idx] == 1 # the first step keeps the initial dt, as in Integrator
+        self.dt[idx] = np.where(first, self.dt[idx], dt_new)
+
+    def track(self, idx, p0, p1, taken): # closest probe-target approach during the step, assuming straight-line relative motion
+        if self.probe is None or self.target is None:
+            return
+        d0 = p0[:, self.probe] - p0[:, self.target]
+        dd = (p1[:, self.probe] - p1[:, self.target]) - d0
+        dd2 = np.einsum('kc,kc->k', dd, dd)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = np.clip(-np.einsum('kc,kc->k', d0, dd) / dd2, 0.0, 1.0)
+        s[dd2 == 0] = 0.0
+        distance = np.linalg.norm(d0 + s[:, None] * dd, axis=1)
+        alive = self.alive[idx]
+        closer = (distance < self.min_distance[idx]) & alive[:, self.probe] & alive[:, self.target]
+        members = idx[closer]
+        self.min_distance[members] = distance[closer]
+        self.min_distance_time[members] = self.time[members] - (1 - s[closer]) * taken[closer]
+
+    def collisions(self, idx, p0, v0, p1, v1, taken): # swept contacts within each member, found and resolved as CollisionHandler does
+        # bodies move along the cubic Hermite through their start and end states, never the straight chord, which
+        # cuts through the central body on a periapsis arc and would flag impacts that never happen
+        members = idx
+        n = len(self.names)
+        first, second = np.triu_indices(n, k=1)
+        alive = self.alive[members]
+        radius = self.radius[members]
+        lo, hi = hermite_boxes(p0.reshape(-1, 3), v0.reshape(-1, 3), p1.reshape(-1, 3), v1.reshape(-1, 3),
+                               np.repeat(taken, n)[:, None], radius.reshape(-1))
+        lo, hi = lo.reshape(len(members), n, 3), hi.reshape(len(members), n, 3)
+        contact = np.all((lo[:, first] <= hi[:, second]) & (lo[:, second] <= hi[:, first]), axis=2) & alive[:, first] & alive[:, second]
+        k, pair = np.nonzero(contact) # broad phase on the path boxes, then the narrow phase on the candidates only
+        if len(k):
+            i, j = first[pair], second[pair]
+            contact[k, pair] = hermite_contact(p0[k, j] - p0[k, i], v0[k, j] - v0[k, i], p1[k, j] - p1[k, i], v1[k, j] - v1[k, i],
+                                               taken[k], radius[k, i] + radius[k, j])
+
+        for row in np.flatnonzero(contact.any(axis=1)): # rare, so resolved member by member
+            k = members[row]
+            for i, j in zip(first[contact[row]], second[contact[row]]):
+                if not (self.alive[k, i] and self.alive[k, j]):
+                    continue
+                if self.mass[k, i] > self.mass[k, j]:
+                    big, small = i, j
+                elif self.mass[k, i] < self.mass[k, j]:
+                    big, small = j, i
+                else:
+                    continue
+                total = self.mass[k, big] + self.mass[k, small]
+                self.vel[k, big] = (self.mass[k, big] * self.vel[k, big] + self.mass[k, small] * self.vel[k, small]) / total
+                self.mass[k, big] = total
+                self.alive[k, small] = False
+                if self.probe in (i, j) and self.impact[k] < 0:
+                    self.impact[k] = big if small == self.probe else small
+                    self.impact_time[k] = self.time[k]
+            self.acc[k] = self.accelerations(self.pos[k:k + 1], self.mass[k:k + 1], self.alive[k:k + 1])[0]
+
+    def run(self, end): # steps until every member has reached end; returns summary()
+        while np.any(self.time < end):
+            self.step(end)
+        return self.summary()
+
+    def summary(self): # per-member results, one array each
+        energy = self.energy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            energy_error = np.where(self.energy_i != 0, np.abs(energy - self.energy_i) / np.abs(self.energy_i), np.abs(energy - self.energy_i))
+        result = {"steps": self.steps, "time": self.time, "energy_error": energy_error,
+                  "impact": self.impact >= 0, "impact_body": self.impact, "impact_time": self.impact_time}
+        if self.target is not None:
+            result["min_distance"] = self.min_distance
+            result["min_distance_time"] = self.min_distance_time
+        result.update({name: value for name, value in self.params.items()})
+        return result
+
+
+def sweep(samples=1, **values): # params for the cartesian product of values, samples members per point
+    # e.g. sweep(tolerance=[.05, .1], max_dt=[1e4, 1e5], samples=50) -> 200 members
+    names = list(values)
+    points = list(itertools.product(*(np.atleast_1d(values[name]) for name in names))) or [()]
+    params = {name: np.repeat([point[i] for point in points], samples) for i, name in enumerate(names)}
+    return params, len(points) * samples
+
+
+def _run_shard(shard, end): # worker task
+    return shard.run(end)
+
+
+def run_ensemble(ensemble, end, processes=None, size=shard_size): # shards across a process pool; one process when it is small
+    shards = ensemble.split(size)
+    if processes == 1 or len(shards) == 1:
+        results = [shard.run(end) for shard in shards]
+    else:
+        context = mp.get_context("spawn") # the same clean-interpreter workers as the viewer
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+            results = list(pool.map(_run_shard, shards, [end] * len(shards)))
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
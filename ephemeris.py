@@ -0,0 +1,173 @@
+# IMPORTS
+import json
+import os
+import numpy as np
+from numpy.polynomial import chebyshev
+from interpolation import hermite, hermite_velocity
+
+# CONSTANTS/SETTINGS
+chebyshev_degree = 10 # polynomial degree per segment and axis
+chebyshev_span = 8 * 86400.0 # seconds per segment; short enough for the Moon's month at this degree
+chebyshev_samples = 12 # states per segment from_world fits at least, Hermite-interpolated between steps longer than span / this
+JD_SECONDS = 86400.0
+
+
+# EPHEMERIS STORE
+class EphemerisStore: # per-body (epochs x 6) state tables in one memory-mapped array, indexed by body and time
+    # a store is a directory holding data.npy (rows of jd, x, y, z, vx, vy, vz, bodies back to back, each sorted
+    # by jd) and index.json (body -> first row and row count)
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        self.data = np.load(os.path.join(path, "data.npy"), mmap_mode="r") # pages are read only when touched
+
+    @classmethod
+    def write(cls, path, tables): # tables is {body: (jd, states)}, e.g. from HorizonsClient.tables
+        os.makedirs(path, exist_ok=True)
+        index = {}
+        blocks = []
+        row = 0
+        for body, (jd, states) in tables.items():
+            order = np.argsort(jd, kind='stable')
+            blocks.append(np.column_stack([jd[order], states[order]]))
+            index[str(body)] = [row, len(jd)]
+            row += len(jd)
+
+        np.save(os.path.join(path, "data.npy"), np.concatenate(blocks) if blocks else np.zeros((0, 7)))
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump(index, f)
+        return cls(path)
+
+    def __contains__(self, body):
+        return str(body) in self.index
+
+    def bodies(self):
+        return list(self.index)
+
+    def table(self, body): # (jd, states) views into the mapped file, no copy
+        start, count = self.index[str(body)]
+        rows = self.data[start:start + count]
+        return rows[:, 0], rows[:, 1:]
+
+    def window(self, body, jd0, jd1): # the samples with jd0 <= jd <= jd1
+        jd, states = self.table(body)
+        i0 = np.searchsorted(jd, jd0, side='left')
+        i1 = np.searchsorted(jd, jd1, side='right')
+        return jd[i0:i1], states[i0:i1]
+
+    def sample(self, body, jd): # the stored state at or just before each jd
+        times, states = self.table(body)
+        i = np.clip(np.searchsorted(times, jd, side='right') - 1, 0, len(times) - 1)
+        return states[i]
+
+
+# CHEBYSHEV EPHEMERIS
+def resample(times, pos, vel, spacing): # the recorded states plus cubic Hermite points between them, at most spacing apart
+    # long steps (e.g. Wisdom-Holman's days) would otherwise leave a segment with too few samples to fit
+    h = np.diff(times)
+    pieces = np.maximum(1, np.ceil(h / spacing)).astype(int)
+    k = np.repeat(np.arange(len(h)), pieces) # the step every new point falls in
+    s = (np.arange(len(k)) - np.repeat(np.cumsum(pieces) - pieces, pieces)) / pieces[k]
+    hk = h[k][:, None, None]
+    new_pos = hermite(pos[k], vel[k], pos[k + 1], vel[k + 1], hk, s)
+    new_vel = hermite_velocity(pos[k], vel[k], pos[k + 1], vel[k + 1], hk, s)
+    return np.append(times[k] + s * h[k], times[-1]), np.concatenate([new_pos, pos[-1:]]), np.concatenate([new_vel, vel[-1:]])
+
+
+class ChebyshevEphemeris: # piecewise Chebyshev fits of many bodies' positions on a shared grid of segments
+    def __init__(self, names, t_start, span, coef, residual=None):
+        self.names = list(names)
+        self.residual = residual # (metres, body name) of the worst position misfit at the fitted samples; None once loaded
+        self.t_start = t_start # seconds; t = 0 is the start of the simulation the ephemeris drives
+        self.span = span
+        self.coef = coef # (segments, bodies, 3, degree + 1)
+        self.degree = coef.shape[-1] - 1
+        self.derivative = chebyshev.chebder(np.eye(self.degree + 1)) # maps coefficients to those of d/dx
+        self.row = {name: i for i, name in enumerate(self.names)}
+
+    def __contains__(self, name):
+        return name in self.row
+
+    @property
+    def t_end(self):
+        return self.t_start + self.span * len(self.coef)
+
+    @classmethod
+    def fit(cls, names, samples, t_start, t_end, span=chebyshev_span, degree=chebyshev_degree):
+        # samples is one (times, pos, vel) per body, times in seconds, pos/vel (samples x 3); positions and
+        # velocities are fitted together in least squares, so a segment needs (degree + 1) / 2 samples at least
+        n_seg = max(1, int(np.ceil((t_end - t_start) / span)))
+        coef = np.zeros((n_seg, len(names), 3, degree + 1))
+        derivative = chebyshev.chebder(np.eye(degree + 1))
+        residual = (0.0, None)
+
+        for b, (times, pos, vel) in enumerate(samples):
+            times = np.asarray(times, dtype=float)
+            for k in range(n_seg):
+                a = t_start + k * span
+                inside = (times >= a - 1e-9 * span) & (times <= a + span * (1 + 1e-9))
+                if 2 * np.count_nonzero(inside) < degree + 1: # lstsq would return a minimum-norm fit, exact at the samples and wild between
+                    raise ValueError(f"{names[b]}: {np.count_nonzero(inside)} samples in segment {k}, "
+                                     f"a degree {degree} fit needs at least {(degree + 2) // 2}")
+                x = 2 * (times[inside] - a) / span - 1
+                T = chebyshev.chebvander(x, degree)
+                dT = chebyshev.chebvander(x, degree - 1) @ derivative # dT/dx; velocity rows are scaled by span / 2 to read in metres
+                A = np.vstack([T, dT])
+                B = np.vstack([pos[inside], vel[inside] * span / 2])
+                coef[k, b] = np.linalg.lstsq(A, B, rcond=None)[0].T
+                misfit = np.max(np.linalg.norm(T @ coef[k, b].T - pos[inside], axis=1))
+                if misfit > residual[0]:
+                    residual = (float(misfit), names[b])
+        return cls(names, t_start, span, coef, residual)
+
+    @classmethod
+    def from_world(cls, world, duration, span=chebyshev_span, degree=chebyshev_degree): # integrates world's massive bodies once and fits them
+        # the fit is only as good as the run: velocities are fitted too, and velocity_verlet's at the default dt are not
+        # the derivative of its positions, so Mercury comes out 1e7 m and more off against about 12 m for a dormand_prince run
+        state = world.state
+        names = [body.name for body in state.bodies]
+        times, pos, vel = [world.integrator.time], [state.pos.copy()], [state.vel.copy()]
+        t_start = world.integrator.time
+        t_end = t_start + span * max(1, np.ceil(duration / span)) # through the last segment, so none is fitted on a sliver
+        while world.integrator.time < t_end:
+            world.integrator.step(state) # massive bodies only; test particles play no part in their motion
+            if len(state) != len(names):
+                raise ValueError("bodies merged while recording an ephemeris")
+            times.append(world.integrator.time)
+            pos.append(state.pos.copy())
+            vel.append(state.vel.copy())
+
+        times, pos, vel = resample(np.array(times), np.array(pos), np.array(vel), span / chebyshev_samples)
+        samples = [(times, pos[:, b], vel[:, b]) for b in range(len(names))]
+        return cls.fit(names, samples, t_start, t_end, span, degree)
+
+    @classmethod
+    def from_store(cls, store, names, epoch_jd, duration, span=chebyshev_span, degree=chebyshev_degree):
+        # names maps store keys (e.g. Horizons ids) to body names; epoch_jd becomes t = 0
+        samples = []
+        for key in names:
+            jd, states = store.window(key, epoch_jd, epoch_jd + duration / JD_SECONDS)
+            samples.append(((jd - epoch_jd) * JD_SECONDS, states[:, :3], states[:, 3:]))
+        return cls.fit(list(names.values()), samples, 0.0, duration, span, degree)
+
+    def _segment(self, t):
+        k = int(np.clip(np.floor((t - self.t_start) / self.span), 0, len(self.coef) - 1))
+        x = 2 * (t - self.t_start - k * self.span) / self.span - 1
+        return k, x
+
+    def position(self, t, rows=slice(None)): # (bodies x 3) at time t
+        k, x = self._segment(t)
+        return self.coef[k, rows] @ chebyshev.chebvander(x, self.degree)[0]
+
+    def velocity(self, t, rows=slice(None)):
+        k, x = self._segment(t)
+        return self.coef[k, rows] @ (chebyshev.chebvander(x, self.degree - 1)[0] @ self.derivative) * (2 / self.span)
+
+    def save(self, path):
+        np.savez(path, names=np.array(self.names), t_start=self.t_start, span=self.span, coef=self.coef)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(list(f["names"]), float(f["t_start"]), float(f["span"]), f["coef"])
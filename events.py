@@ -0,0 +1,249 @@
+# IMPORTS
+import json
+import os
+import numpy as np
+from interpolation import hermite, hermite_velocity
+
+# CONSTANTS/SETTINGS
+event_tolerance = 1e-3 # simulated seconds an event time is located to
+event_samples = 8 # points per step every event function is checked at, so two roots inside one long step are both bracketed
+
+
+# DENSE OUTPUT
+class DenseStep: # piecewise cubic Hermite through knots inside one World step, for the rows the events watch
+    # the knots are the step's two ends, plus the Dormand-Prince substeps when test particles took several
+    def __init__(self, times, pos, vel, radius): # times (knots,), pos and vel (knots, rows, 3)
+        self.times = times
+        self.pos = pos
+        self.vel = vel
+        self.radius = radius
+
+    def grid(self, samples): # samples points per piece and the end, where event functions are first checked
+        h = np.diff(self.times)
+        return np.append((self.times[:-1, None] + h[:, None] * np.linspace(0.0, 1.0, samples, endpoint=False)).ravel(), self.times[-1])
+
+    def at(self, t, rows): # (pos, vel) of rows at time t; an array of times adds a leading axis
+        j = np.clip(np.searchsorted(self.times, t, side="right") - 1, 0, len(self.times) - 2)
+        h = self.times[j + 1] - self.times[j]
+        s = (t - self.times[j]) / h
+        if np.ndim(t):
+            h = h[:, None, None]
+        p0, v0 = self.pos[j][..., rows, :], self.vel[j][..., rows, :]
+        p1, v1 = self.pos[j + 1][..., rows, :], self.vel[j + 1][..., rows, :]
+        return hermite(p0, v0, p1, v1, h, s), hermite_velocity(p0, v0, p1, v1, h, s)
+
+
+# EVENT FUNCTIONS
+class Event: # a zero of g(pos, vel, radius) of some bodies, crossed in direction
+    # direction +1: g goes from negative to non-negative, -1 from positive to non-positive, 0 either way
+    kind = "event"
+    direction = 0
+
+    def __init__(self, *bodies, label=None):
+        self.bodies = list(bodies)
+        self.label = label or " ".join([self.kind, *bodies])
+
+    def g(self, pos, vel, radius): # pos, vel (..., bodies, 3) and radius (bodies,) -> (...)
+        raise NotImplementedError
+
+    def details(self, pos, vel, radius): # extra fields of the logged record, at the located time
+        return {}
+
+    def occurrences(self, step, rows, samples, tolerance): # times inside the step where the event happens
+        t = step.grid(samples)
+        g = self.g(*step.at(t, rows), step.radius[rows])
+        rising = (g[:-1] < 0) & (g[1:] >= 0)
+        falling = (g[:-1] > 0) & (g[1:] <= 0)
+        crossed = rising if self.direction > 0 else falling if self.direction < 0 else rising | falling
+        found = []
+        for k in np.flatnonzero(crossed): # bisection on the bracket; the interpolant is cheap, so no derivative needed
+            a, b = t[k], t[k + 1]
+            g_a = g[k] # never zero: the crossing tests above exclude it
+            while b - a > tolerance:
+                m = .5 * (a + b)
+                g_m = self.g(*step.at(m, rows), step.radius[rows])
+                if np.sign(g_m) == np.sign(g_a):
+                    a = m
+                else:
+                    b = m
+            found.append(b)
+        return found
+
+
+class Approach(Event): # closest approach of two bodies: their range rate goes from negative to positive
+    kind = "approach"
+    direction = 1
+
+    def g(self, pos, vel, radius):
+        return np.einsum('...c,...c->...', pos[..., 0, :] - pos[..., 1, :], vel[..., 0, :] - vel[..., 1, :])
+
+    def details(self, pos, vel, radius):
+        return {"distance": float(np.linalg.norm(pos[0] - pos[1])), "speed": float(np.linalg.norm(vel[0] - vel[1]))}
+
+
+class Periapsis(Approach): # closest point of body's orbit about center
+    kind = "periapsis"
+
+
+class Apoapsis(Approach): # farthest point of body's orbit about center
+    kind = "apoapsis"
+    direction = -1
+
+
+class Crossing(Event): # body passes through the plane through center (the origin without one) with the given normal
+    # the default normal crosses the reference xy plane, i.e. the ecliptic nodes for the solar_system scene
+    kind = "crossing"
+
+    def __init__(self, body, center=None, normal=(0.0, 0.0, 1.0), direction=0, label=None):
+        super().__init__(*([body, center] if center else [body]), label=label)
+        self.normal = np.asarray(normal, dtype=float) / np.linalg.norm(normal)
+        self.direction = direction
+
+    def relative(self, pos, vel):
+        if len(self.bodies) == 1:
+            return pos[..., 0, :], vel[..., 0, :]
+        return pos[..., 0, :] - pos[..., 1, :], vel[..., 0, :] - vel[..., 1, :]
+
+    def g(self, pos, vel, radius):
+        return self.relative(pos, vel)[0] @ self.normal
+
+    def details(self, pos, vel, radius):
+        r, v = self.relative(pos, vel)
+        return {"node": "ascending" if v @ self.normal > 0 else "descending", "distance": float(np.linalg.norm(r))}
+
+
+class Contact(Event): # the surfaces of two bodies touch: separation minus both radii goes from positive to zero
+    kind = "contact"
+    direction = -1
+
+    def g(self, pos, vel, radius):
+        return np.linalg.norm(pos[..., 0, :] - pos[..., 1, :], axis=-1) - radius[0] - radius[1]
+
+    def details(self, pos, vel, radius):
+        return {"speed": float(np.linalg.norm(vel[0] - vel[1]))}
+
+
+class Output(Event): # states of bodies at fixed times: every multiple of interval and/or the listed times
+    kind = "output"
+
+    def __init__(self, *bodies, interval=None, times=(), label=None):
+        super().__init__(*bodies, label=label or ("output " + " ".join(bodies) if len(bodies) <= 3 else "output"))
+        self.interval = interval
+        self.times = np.sort(np.asarray(times, dtype=float))
+
+    def occurrences(self, step, rows, samples, tolerance): # no roots to find: the times are known up front
+        t0, t1 = step.times[0], step.times[-1]
+        due = self.times[(self.times > t0) & (self.times <= t1)]
+        if self.interval:
+            due = np.union1d(due, self.interval * np.arange(np.floor(t0 / self.interval) + 1, np.floor(t1 / self.interval) + 1))
+        return list(due)
+
+    def details(self, pos, vel, radius):
+        return {"state": {name: [*map(float, p), *map(float, v)] for name, p, v in zip(self.bodies, pos, vel)}}
+
+
+EVENTS = {cls.kind: cls for cls in (Approach, Periapsis, Apoapsis, Crossing, Contact, Output)}
+
+
+# EVENTS
+class Events: # locates registered events on each World step's dense output and logs them as a stream of records
+    # the step itself is never shortened: events are found between steps of whatever size the integrator chose.
+    # out is an optional JSON Lines file, one record per event in time order; resume is the time of the checkpoint a
+    # run restarts from, and records after it are dropped from out
+    def __init__(self, events=(), tolerance=event_tolerance, samples=event_samples, out=None, resume=None):
+        self.events = list(events)
+        self.tolerance = tolerance
+        self.samples = samples
+        self.log = [] # records, each {"time", "kind", "label", "bodies", ...details}
+        self.found = {} # body name -> (group, row, body) where it was last seen, None once it has gone
+        self.start = None
+        kept = []
+        if out and resume is not None and os.path.exists(out):
+            with open(out) as f:
+                kept = [line for line in f if json.loads(line)["time"] <= resume]
+        self.file = open(out, "w") if out else None
+        if self.file:
+            self.file.writelines(kept)
+            self.file.flush()
+
+    def add(self, event):
+        self.events.append(event)
+
+    def locate(self, world, name): # (group, row) of a body by name, None once it is gone
+        if name in self.found:
+            if self.found[name] is None:
+                return None # absorbed earlier; not searched for again every step
+            group, i, body = self.found[name]
+            bodies = getattr(world, group).bodies
+            if i < len(bodies) and bodies[i] is body: # rows only move when merges compact the store
+                return group, i
+        for group in ("state", "tests"):
+            for i, body in enumerate(getattr(world, group).bodies):
+                if body.name == name:
+                    self.found[name] = (group, i, body)
+                    return group, i
+        self.found[name] = None
+        return None
+
+    def rows(self, world): # where every watched body is now
+        names = dict.fromkeys(name for event in self.events for name in event.bodies)
+        return {name: where for name in names if (where := self.locate(world, name)) is not None}
+
+    def gather(self, world, where, column): # one column of the watched rows, in the order of where
+        return np.array([getattr(getattr(world, group), column)[i] for group, i in where.values()], dtype=float)
+
+    def begin(self, world): # before the integrator step: the start of the dense output
+        where = self.rows(world)
+        self.start = (world.integrator.time, where, self.gather(world, where, "pos"), self.gather(world, where, "vel"))
+
+    def substeps(self, t0, h, knots, p0, v0, p1, v1, tests, rows): # knots at the Dormand-Prince substeps the test particles took
+        # knots is Integrator.test_knots, the path test_step actually integrated; one cubic across the whole step
+        # cannot follow e.g. a close pass that took the integrator many substeps
+        times = t0 + np.array([t for t, _, _ in knots])
+        times[-1] = t0 + h
+        s = (times - t0) / h
+        pos = hermite(p0, v0, p1, v1, h, s) # massive rows: the single step's interpolant, evaluated at the knots
+        vel = hermite_velocity(p0, v0, p1, v1, h, s)
+        pos[:, tests] = [x[rows] for _, x, _ in knots]
+        vel[:, tests] = [v[rows] for _, _, v in knots]
+        return times, pos, vel
+
+    def detect(self, world): # after the integrator step and before collisions can remove rows
+        t0, where, p0, v0 = self.start
+        integrator = world.integrator
+        h = integrator.time - t0
+        if h <= 0 or not where:
+            return []
+        p1 = self.gather(world, where, "pos")
+        v1 = self.gather(world, where, "vel")
+        times, pos, vel = np.array([t0, t0 + h]), np.stack([p0, p1]), np.stack([v0, v1])
+        tests = [k for k, (group, _) in enumerate(where.values()) if group == "tests"]
+        knots = integrator.test_knots
+        if tests and knots is not None and len(knots) > 2: # they took substeps that one cubic over the step would smooth over
+            rows = [i for group, i in where.values() if group == "tests"]
+            times, pos, vel = self.substeps(t0, h, knots, p0, v0, p1, v1, tests, rows)
+        step = DenseStep(times, pos, vel, self.gather(world, where, "radius"))
+        index = {name: k for k, name in enumerate(where)}
+
+        records = []
+        for event in self.events:
+            if any(name not in index for name in event.bodies):
+                continue # a body it watches has merged away
+            rows = [index[name] for name in event.bodies]
+            for t in event.occurrences(step, rows, self.samples, self.tolerance):
+                pos, vel = step.at(t, rows)
+                records.append({"time": float(t), "kind": event.kind, "label": event.label, "bodies": event.bodies,
+                                **event.details(pos, vel, step.radius[rows])})
+        records.sort(key=lambda record: record["time"])
+        self.log.extend(records)
+        if self.file and records:
+            self.file.writelines(json.dumps(record) + "\n" for record in records)
+            self.file.flush()
+        return records
+
+    def of(self, label): # records of one event, e.g. of("approach AsteroidX Earth")
+        return [record for record in self.log if record["label"] == label]
+
+    def close(self):
+        if self.file:
+            self.file.close()
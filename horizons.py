@@ -1,42 +1,120 @@
-import requests
+# IMPORTS
+import hashlib
+import io
+import os
 import re
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
 
-START_TIME = str(input("INPUT DESIRED DATE (yyyy-mm-dd)\n"))
+# CONSTANTS/SETTINGS
+HORIZONS_URL = "https://ssd.jpl.nasa.gov/api/horizons.api"
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".horizons_cache")
+max_workers = 8 # concurrent requests; Horizons asks clients not to hammer it
+timeout = 30 # seconds per request
+KM_TO_M = 1000
 
-url = "https://ssd.jpl.nasa.gov/api/horizons.api"
-params = {
-    "format": "text",
-    "COMMAND": "'499'",           # Mars
-    "CENTER": "'500@10'",         # Sun as reference
-    "MAKE_EPHEM": "YES",
-    "EPHEM_TYPE": "VECTORS",     # Cartesian state vectors
-    "START_TIME": "'2025-08-12'",
-    "STOP_TIME": "'2025-08-13'",
-    "STEP_SIZE": "'1d'",
-}
 
-response = requests.get(url, params=params)
-data = response.text
-print(data)
-# Extract lines after $$SOE
-lines = data.splitlines()
-start_idx = next(i for i, line in enumerate(lines) if "$$SOE" in line) + 1
+# HORIZONS CLIENT
+class HorizonsClient: # state vectors from JPL Horizons, fetched in parallel over one session and cached on disk
+    def __init__(self, url=HORIZONS_URL, cache_dir=CACHE_DIR, workers=max_workers):
+        self.url = url
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.session = requests.Session() # keeps connections alive across requests
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.requests_made = 0
 
+    def cache_path(self, body, center, epoch, step): # one file per (body, center, epoch, step)
+        key = f"{body}|{center}|{epoch}|{step}"
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{re.sub(r'[^A-Za-z0-9]+', '_', str(body))}_{digest}.txt")
 
-x = y = z = vx = vy = vz = None
-for line in lines[start_idx:]:
-    if line.startswith(" X ="):
-        numbers = re.findall(r"[-+]?\d*\.\d+E[+-]\d+", line)
-        x, y, z = map(float, numbers)
-    elif line.startswith(" VX="):
-        numbers = re.findall(r"[-+]?\d*\.\d+E[+-]\d+", line)
-        vx, vy, vz = map(float, numbers)
-        break  # Stop after first velocity line—first day done
+    def fetch(self, body, epoch, center="500@0", step="1d", stop=None): # raw Horizons vector table, from the cache when possible
+        stop = stop or next_day(epoch)
+        path = self.cache_path(body, center, f"{epoch}/{stop}", step)
+        if os.path.exists(path):
+            with open(path) as f:
+                return f.read()
 
+        params = {
+            "format": "text",
+            "COMMAND": f"'{body}'",
+            "CENTER": f"'{center}'",
+            "MAKE_EPHEM": "YES",
+            "EPHEM_TYPE": "VECTORS", # Cartesian state vectors
+            "OUT_UNITS": "'KM-S'",
+            "VEC_TABLE": "'2'", # position and velocity only
+            "CSV_FORMAT": "'YES'",
+            "START_TIME": f"'{epoch}'",
+            "STOP_TIME": f"'{stop}'",
+            "STEP_SIZE": f"'{step}'",
+        }
+        response = self.session.get(self.url, params=params, timeout=timeout)
+        self.requests_made += 1
+        response.raise_for_status()
+        data = response.text
+        if "$$SOE" not in data: # Horizons reports bad ids and dates in the body of a 200 response
+            raise ValueError(f"Horizons returned no vectors for {body} at {epoch}: {data.strip()[:200]}")
 
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, path) # atomic, so a concurrent reader never sees half a file
+        return data
 
-KM_TO_M = 1000
-x, y, z, = x*KM_TO_M, y*KM_TO_M, z*KM_TO_M
-vx, vy, vz, = vx*KM_TO_M, vy*KM_TO_M, vz*KM_TO_M
-print("Position:", x, y, z)
-print("Velocity:", vx, vy, vz)
+    def fetch_all(self, bodies, epoch, center="500@0", step="1d"): # {body: text}, fetched concurrently by a bounded pool
+        bodies = list(bodies)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            texts = pool.map(lambda body: self.fetch(body, epoch, center, step), bodies)
+            return dict(zip(bodies, texts))
+
+    def state_vectors(self, bodies, epoch, center="500@0"): # {body: ([x, y, z], [vx, vy, vz])} in metres and m/s at epoch
+        return {body: parse_vectors(text) for body, text in self.fetch_all(bodies, epoch, center).items()}
+
+    def tables(self, bodies, start, stop, step="1d", center="500@0"): # {body: (jd, states)} over [start, stop], see parse_table
+        bodies = list(bodies)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            texts = pool.map(lambda body: self.fetch(body, start, center, step, stop), bodies)
+            return {body: parse_table(text) for body, text in zip(bodies, texts)}
+
+    def store(self, path, bodies, start, stop, step="1d", center="500@0"): # tables written straight to an EphemerisStore
+        from ephemeris import EphemerisStore
+        return EphemerisStore.write(path, self.tables(bodies, start, stop, step, center))
+
+
+def next_day(epoch): # Horizons needs a stop time after the start
+    return (datetime.date.fromisoformat(epoch[:10]) + datetime.timedelta(days=1)).isoformat()
+
+
+def parse_table(data): # every epoch of a Horizons VECTORS table -> (jd, states), states is epochs x 6 in metres and m/s
+    start = data.index("$$SOE") + len("$$SOE")
+    block = data[start:data.index("$$EOE", start)]
+
+    if "," in block: # CSV_FORMAT: JDTDB, calendar date, X, Y, Z, VX, VY, VZ, one epoch per line, parsed in C
+        rows = np.loadtxt(io.StringIO(block), delimiter=",", usecols=(0, 2, 3, 4, 5, 6, 7), ndmin=2)
+        jd, states = rows[:, 0], rows[:, 1:]
+    else: # the default text layout, as in older cached responses: one regex pass over the whole block
+        jd = np.array(re.findall(r"^\s*(\d+\.\d+) = A\.D\.", block, re.M), dtype=float)
+        values = re.findall(r"\b(?:X|Y|Z|VX|VY|VZ) ?= ?([-+]?\d*\.\d+E[+-]\d+)", block)
+        states = np.array(values, dtype=float).reshape(-1, 6)
+    return jd, states * KM_TO_M
+
+
+def parse_vectors(data): # first state vector of a Horizons VECTORS table, converted to SI
+    jd, states = parse_table(data)
+    return list(states[0, :3]), list(states[0, 3:])
+
+
+if __name__ == "__main__":
+    from main import HORIZONS_IDS
+
+    START_TIME = str(input("INPUT DESIRED DATE (yyyy-mm-dd)\n"))
+    vectors = HorizonsClient().state_vectors(HORIZONS_IDS.values(), START_TIME)
+    for name, body in HORIZONS_IDS.items():
+        pos, vel = vectors[body]
+        print(f"{name:>8}  Position: {pos}  Velocity: {vel}")
@@ -0,0 +1,23 @@
+# IMPORTS
+import numpy as np
+
+
+def hermite(p0, v0, p1, v1, h, s): # cubic Hermite position at fraction s of an interval of length h
+    s = np.asarray(s, dtype=float)[..., None, None] if np.ndim(s) else s
+    s2 = s * s
+    s3 = s2 * s
+    h00 = 2 * s3 - 3 * s2 + 1
+    h10 = s3 - 2 * s2 + s
+    h01 = -2 * s3 + 3 * s2
+    h11 = s3 - s2
+    return h00 * p0 + h10 * h * v0 + h01 * p1 + h11 * h * v1
+
+
+def hermite_velocity(p0, v0, p1, v1, h, s): # time derivative of hermite()
+    s = np.asarray(s, dtype=float)[..., None, None] if np.ndim(s) else s
+    s2 = s * s
+    d00 = (6 * s2 - 6 * s) / h
+    d10 = 3 * s2 - 4 * s + 1
+    d01 = (-6 * s2 + 6 * s) / h
+    d11 = 3 * s2 - 2 * s
+    return d00 * p0 + d10 * v0 + d01 * p1 + d11 * v1
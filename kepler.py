@@ -0,0 +1,83 @@
+# IMPORTS
+import numpy as np
+
+# CONSTANTS/SETTINGS
+max_iterations = 50
+kepler_tolerance = 1e-14
+
+
+def stumpff(z): # Stumpff functions C(z), S(z) for elliptic (z > 0), parabolic and hyperbolic (z < 0) arcs
+    C = np.empty_like(z)
+    S = np.empty_like(z)
+
+    small = np.abs(z) < 1e-2 # series near z = 0 avoids the cancellation in the closed forms
+    zs = z[small]
+    C[small] = 1/2 - zs/24 + zs**2/720 - zs**3/40320 + zs**4/3628800
+    S[small] = 1/6 - zs/120 + zs**2/5040 - zs**3/362880 + zs**4/39916800
+
+    pos = (z > 0) & ~small
+    sz = np.sqrt(z[pos])
+    C[pos] = (1 - np.cos(sz)) / z[pos]
+    S[pos] = (sz - np.sin(sz)) / sz**3
+
+    neg = (z < 0) & ~small
+    sz = np.sqrt(-z[neg])
+    C[neg] = (np.cosh(sz) - 1) / -z[neg]
+    S[neg] = (np.sinh(sz) - sz) / sz**3
+
+    return C, S
+
+
+def kepler_drift(pos, vel, mu, dt): # advances every (pos, vel) row along its two-body orbit about mu by dt
+    # universal-variable formulation, so elliptic, parabolic and hyperbolic orbits share one solver
+    r0 = np.linalg.norm(pos, axis=1)
+    v2 = np.sum(vel * vel, axis=1)
+    mu = np.broadcast_to(mu, r0.shape)
+    sqrt_mu = np.sqrt(mu)
+    sigma0 = np.sum(pos * vel, axis=1) / sqrt_mu # r0 * vr0 / sqrt(mu)
+    alpha = 2 / r0 - v2 / mu # reciprocal semi-major axis
+
+    # Laguerre-Conway iteration on the universal anomaly chi
+    chi = sqrt_mu * alpha * dt # elliptic guess
+    unbound = alpha <= 0
+    chi[unbound] = sqrt_mu[unbound] * dt / r0[unbound] # parabolic fallback
+
+    hyper = alpha < 0 # Vallado's guess for hyperbolic arcs, which keeps the Stumpff functions from overflowing
+    a = 1 / alpha[hyper]
+    rv = sigma0[hyper] * sqrt_mu[hyper]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        guess = np.sign(dt) * np.sqrt(-a) * np.log(-2 * mu[hyper] * alpha[hyper] * dt
+                                                   / (rv + np.sign(dt) * np.sqrt(-mu[hyper] * a) * (1 - r0[hyper] * alpha[hyper])))
+    chi[hyper] = np.where(np.isfinite(guess), guess, chi[hyper])
+    active = np.ones(len(pos), dtype=bool)
+
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+        x = chi[active]
+        a, s0, rr, sm = alpha[active], sigma0[active], r0[active], sqrt_mu[active]
+        z = a * x * x
+        C, S = stumpff(z)
+
+        f = s0 * x * x * C + (1 - a * rr) * x**3 * S + rr * x - sm * dt
+        df = s0 * x * (1 - z * S) + (1 - a * rr) * x * x * C + rr # equals r at chi
+        ddf = s0 * (1 - z * C) + (1 - a * rr) * x * (1 - z * S)
+
+        n = 5
+        root = np.sqrt(np.abs((n - 1)**2 * df * df - n * (n - 1) * f * ddf))
+        delta = n * f / (df + np.sign(df) * root)
+        chi[active] = x - delta
+        active[active] = np.abs(delta) > kepler_tolerance * np.maximum(np.abs(x), 1.0)
+
+    # Lagrange f and g coefficients
+    z = alpha * chi * chi
+    C, S = stumpff(z)
+    f = 1 - chi * chi / r0 * C
+    g = dt - chi**3 / sqrt_mu * S
+    new_pos = f[:, None] * pos + g[:, None] * vel
+    r = np.linalg.norm(new_pos, axis=1)
+    fdot = sqrt_mu / (r * r0) * (z * S - 1) * chi
+    gdot = 1 - chi * chi / r * C
+    new_vel = fdot[:, None] * pos + gdot[:, None] * vel
+
+    return new_pos, new_vel
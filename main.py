@@ -1,8 +1,12 @@
 # IMPORTS
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from render import PygameRenderer
-import requests
-import re
+from octree import Octree
+from kepler import kepler_drift
+from interpolation import hermite, hermite_velocity
+from broadphase import sweep_and_prune, swept_boxes, swept_contact, hermite_boxes, hermite_contact
 
 # CONSTANTS/SETTINGS
 G = 6.6743E-11
@@ -13,6 +17,8 @@ fps_limit = 0
 render_step = 10
 mass_threshold = 1e20
 eps = 1e-12
+force_backend = "direct" # "direct" (pairwise), "tree" (Barnes-Hut) or "parallel" (direct on every core)
+θ = .5 # Barnes-Hut opening angle; smaller is more accurate and slower
 
 tolerance = 10e-2
 α = .5
@@ -20,6 +26,9 @@ safe_factor = .9
 β = .2
 min_dt = .01
 max_dt = 100000
+integrator_method = "velocity_verlet" # any key of INTEGRATORS
+rk_tolerance = 1e-10 # relative error per step for Dormand-Prince
+changeover_hill = 3.0 # mercury: pairs closer than this many Hill radii leave the Wisdom-Holman split for Dormand-Prince
 
 HORIZONS_IDS = {
     "Mercury": 199,
@@ -42,71 +51,547 @@ HORIZONS_IDS = {
 
 # INTEGRATION
 class Integrator:
-    def __init__(self, force_calc, dt):
+    def __init__(self, force_calc, dt, method=integrator_method):
         self.force_calc = force_calc
         self.dt = dt
+        self.method = method # key into INTEGRATORS
+        self.test_dt = dt # Dormand-Prince substep for the test particles
+        self.test_knots = None # (time into the step, pos, vel) of the test particles at every substep of the last step
+        self.encounter_dt = dt # Dormand-Prince substep for the close pairs of mercury
+        self.ephemeris = None # ChebyshevEphemeris the massive bodies follow instead of being integrated
+        self._kick_cache = None # (pos, mass, acc) of the last Wisdom-Holman interaction kick
+        self._test_sources = None # (pos, mass) of the massive bodies the test particles' acc was last evaluated against
+        self._changeover = None # (mass, r_crit) of mercury, fixed until the bodies change
+        self.stats = None # optional Stats that force passes and adaptive_dt are timed into
         self.time = 0.0
         self.steps = 0
-        self.F_prev = {}
+        self.force_evals = 0 # force passes
+        self.body_evals = 0 # body accelerations computed across all passes
+        self.F_prev = np.zeros((0, 3)) # start-of-step accelerations of the last step, one row per body
 
-    def velocity_verlet(self, objects):
+    def force_pass(self, targets, state, compute, *args): # every force pass goes through here so it can be counted
+        self.force_evals += 1
+        self.body_evals += targets
+        if self.stats is None:
+            return compute(*args)
+        t0 = time.perf_counter()
+        result = compute(*args)
+        self.stats.force(time.perf_counter() - t0, targets, self.force_calc.interactions(targets, state))
+        return result
+
+    def accelerations(self, state):
+        return self.force_pass(len(state), state, self.force_calc.accelerations, state)
+
+    def accelerations_of(self, state, idx): # accelerations of the bodies in idx only
+        return self.force_pass(len(idx), state, self.force_calc.accelerations_of, state, idx)
+
+    def field_at(self, points, state): # accelerations at points from the bodies of state
+        return self.force_pass(len(points), state, self.force_calc.field_at, points, state)
+
+    def start_acc(self, state): # first-same-as-last: a(t) is the previous step's a(t + dt) unless the state was changed since
+        if not state.acc_valid:
+            state.acc[:] = self.accelerations(state)
+            state.acc_valid = True
+        self.F_prev = state.acc.copy()
+        return self.F_prev
+
+    def velocity_verlet(self, state):
         dt = self.dt
 
         # 1)
-        a0_list = [self.force_calc.accel_calc(o, objects) for o in objects]
+        a0 = self.start_acc(state)
 
         # 2)
-        for o, a0 in zip(objects, a0_list):
-            o.pos += o.vel * dt + .5 * a0 * dt * dt
+        state.pos += state.vel * dt + .5 * a0 * dt * dt
 
         # 3)
-        a1_list = [self.force_calc.accel_calc(o, objects) for o in objects]
+        a1 = self.accelerations(state)
 
         # 4)
-        for o, acc0, acc in zip(objects, a0_list, a1_list):
-            o.vel += .5 * (acc0 + acc) * dt
-            o.acc = acc
- 
-    def euler(self, obj, objects):  # legacy only
-        obj.pos += obj.vel * dt
-        obj.vel += obj.acc * dt
-        obj.acc = self.force_calc.accel_calc(obj, objects)
-
-    def adaptive_dt(self, objects):
-        dt_smooth_list = []
-
-        for object in objects:
-            F_current = self.force_calc.gravity_force(object, objects) # find current force
-            if object not in self.F_prev: # if object isn't already storing a previous force 
-                self.F_prev[object] = F_current # set the object's previous force to current force
-                dt_smooth_list.append(self.dt) # pass tis force as the "new dt"
-                continue
+        state.vel += .5 * (a0 + a1) * dt
+        state.acc[:] = a1
+        return dt
+
+    def euler(self, state):  # legacy only
+        dt = self.dt
+        a0 = self.start_acc(state)
+        state.pos += state.vel * dt
+        state.vel += a0 * dt
+        state.acc[:] = self.accelerations(state)
+        return dt
+
+    def composition(self, state, weights): # symmetric composition of KDK leapfrog substeps of weight * dt
+        dt = self.dt
+        a = self.start_acc(state)
+
+        for w in weights: # the closing kick of one substep and the opening kick of the next share a force pass
+            h = w * dt
+            state.vel += .5 * h * a
+            state.pos += h * state.vel
+            a = self.accelerations(state)
+            state.vel += .5 * h * a
+
+        state.acc[:] = a
+        return dt
+
+    def yoshida4(self, state):
+        return self.composition(state, YOSHIDA4)
+
+    def yoshida6(self, state):
+        return self.composition(state, YOSHIDA6)
+
+    def forest_ruth(self, state): # Forest & Ruth's 4th-order scheme in its original position-first (DKD) form
+        dt = self.dt
+        w = FOREST_RUTH
+
+        state.pos += .5 * w * dt * state.vel
+        a = self.accelerations(state)
+        self.F_prev = a # the controller compares the first and last kicks
+        state.vel += w * dt * a
+        state.pos += .5 * (1 - w) * dt * state.vel
+        a = self.accelerations(state)
+        state.vel += (1 - 2 * w) * dt * a
+        state.pos += .5 * (1 - w) * dt * state.vel
+        a = self.accelerations(state)
+        state.vel += w * dt * a
+        state.pos += .5 * w * dt * state.vel
+
+        state.acc[:] = a
+        state.acc_valid = False # the last kick was not evaluated at the final positions
+        return dt
+
+    def rk_step(self, pos, vel, a0, accel, t, h): # one Dormand-Prince 5(4) step of x'' = accel(x, t); returns the error per body too
+        kx = [vel]
+        kv = [a0]
+        for i in range(1, 7):
+            x = pos + h * sum(a * k for a, k in zip(DOPRI_A[i], kx) if a)
+            v = vel + h * sum(a * k for a, k in zip(DOPRI_A[i], kv) if a)
+            kx.append(v)
+            kv.append(accel(x, t + DOPRI_C[i] * h))
+
+        # the 7th stage sits at the 5th-order solution, so kv[6] is a(t + h) for free
+        err_x = h * sum(e * k for e, k in zip(DOPRI_E, kx) if e)
+        err_v = h * sum(e * k for e, k in zip(DOPRI_E, kv) if e)
+        scale_x = rk_tolerance * np.maximum(np.linalg.norm(pos, axis=1), np.linalg.norm(x, axis=1)) + eps
+        scale_v = rk_tolerance * np.maximum(np.linalg.norm(vel, axis=1), np.linalg.norm(v, axis=1)) + eps
+        err = np.maximum(np.linalg.norm(err_x, axis=1) / scale_x, np.linalg.norm(err_v, axis=1) / scale_v)
+        return x, v, kv[6], err
 
-            F_prev_obj = self.F_prev[object] # access previous force
-            dF_rel = np.linalg.norm(F_current - F_prev_obj)/ (np.linalg.norm(F_current) + eps) # calculate the relative delta F
+    def rk_next_dt(self, h, err): # embedded-error step controller; err <= 1 means the step met rk_tolerance
+        with np.errstate(divide='ignore'):
+            factor = min(5.0, max(.2, safe_factor * err**(-1/5)))
+        return max(min_dt, min(max_dt, h * factor))
 
-            self.F_prev[object] = F_current # store current force as previous force for next time
+    def dormand_prince(self, state): # adaptive embedded Runge-Kutta; retries rejected steps with a smaller dt
+        a0 = self.start_acc(state)
 
+        def accel(pos, t):
+            return self.accelerations(state.replace(pos=pos))
+
+        while True:
+            h = self.dt
+            x, v, a1, err = self.rk_step(state.pos, state.vel, a0, accel, 0.0, h)
+            err = np.max(err, initial=0.0)
+            self.dt = self.rk_next_dt(h, err)
+            if err <= 1 or h <= min_dt:
+                break
+
+        state.pos[:] = x
+        state.vel[:] = v
+        state.acc[:] = a1
+        return h
+
+    def rk_propagate(self, pos, vel, a0, accel, duration, h_try, knots=None): # Dormand-Prince substeps that land exactly on duration; also returns the next substep
+        # knots, if given, is a list every accepted substep's (time, pos, vel) is appended to, e.g. for dense output
+        remaining = duration
+        while remaining > 0:
+            h = min(h_try, remaining)
+            x, v, a1, err = self.rk_step(pos, vel, a0, accel, duration - remaining, h)
+            err = np.max(err, initial=0.0)
+            h_next = self.rk_next_dt(h, err)
+            if h == h_try or h_next < h_try: # a step cut short by the interval end says little about growth
+                h_try = h_next
+            if err <= 1 or h <= min_dt:
+                pos, vel, a0 = x, v, a1
+                remaining -= h
+                if knots is not None:
+                    knots.append((duration - remaining, pos, vel))
+        return pos, vel, a0, h_try
+
+    def adaptive_dt(self, state): # driven by the start/end-of-step accelerations, no extra force pass
+        if len(state) == 0 or self.steps == 1:
+            return # the first step keeps the initial dt, as before
+
+        F_current = state.acc # end-of-step force per unit mass (becomes next step's a0)
+        dF_rel = np.linalg.norm(F_current - self.F_prev, axis=1) / (np.linalg.norm(F_current, axis=1) + eps) # relative delta F, i.e. |jerk| * dt / |a|
+
+        with np.errstate(divide='ignore'):
             dt_candidate = self.dt * (tolerance/dF_rel)**α # variable dt equations
-            dt_safe = safe_factor * dt_candidate
-            dt_smooth = (1-β)*self.dt + β*dt_safe
-            dt_smooth_list.append(dt_smooth)
-            
-        dt_new = max(min_dt, min(max_dt, min(dt_smooth_list))) # set new dt with min and max dt
+        dt_safe = safe_factor * dt_candidate
+        dt_smooth = (1-β)*self.dt + β*dt_safe
+
+        dt_new = max(min_dt, min(max_dt, np.min(dt_smooth))) # set new dt with min and max dt
         self.dt = dt_new # update class property for use in simulation
-        
 
+    def smooth_dt(self, dt_body, a0, a1): # adaptive_dt's controller applied per body instead of taking the min
+        dF_rel = np.linalg.norm(a1 - a0, axis=1) / (np.linalg.norm(a1, axis=1) + eps)
+        with np.errstate(divide='ignore'):
+            dt_candidate = dt_body * (tolerance/dF_rel)**α
+        dt_safe = safe_factor * dt_candidate
+        dt_smooth = (1-β)*dt_body + β*dt_safe
+        return np.clip(dt_smooth, min_dt, max_dt)
+
+    def block_step(self, state): # hierarchical KDK leapfrog: one base step of max_dt, per-body steps of max_dt / 2**rung
+        n = len(state)
+        levels = int(np.ceil(np.log2(max_dt / min_dt))) # deepest rung allowed by min_dt
+        end = 2**levels # base step in ticks
+        tick_dt = max_dt / end
+
+        def rung_of(dt_body): # coarsest rung whose step is not longer than dt_body
+            return np.clip(np.ceil(np.log2(max_dt / dt_body)), 0, levels).astype(np.int64)
+
+        self.start_acc(state)
+        state.dt[np.isnan(state.dt)] = self.dt # new bodies start from the global dt
+
+        rung = rung_of(state.dt)
+        length = 2**(levels - rung) # step of each body in ticks
+        start = np.zeros(n, dtype=np.int64)
+        tick = 0
+
+        state.vel += .5 * state.acc * (length * tick_dt)[:, None] # opening half kick
+
+        while tick < end:
+            next_tick = np.min(start + length)
+            state.pos += state.vel * ((next_tick - tick) * tick_dt) # everyone drifts; inactive bodies move on their mid-step velocity
+            tick = next_tick
+
+            idx = np.flatnonzero(start + length == tick) # the active rungs finish their step here
+            a1 = self.accelerations_of(state, idx)
+            step_dt = length[idx] * tick_dt
+            state.vel[idx] += .5 * a1 * step_dt[:, None] # closing half kick
+
+            state.dt[idx] = self.smooth_dt(step_dt, state.acc[idx], a1)
+            state.acc[idx] = a1
+            if tick == end:
+                break
+
+            # refine freely; coarsen by one rung only where the coarser step lines up with this tick
+            new_rung = rung_of(state.dt[idx])
+            aligned = tick % (2 * length[idx]) == 0
+            new_rung = np.where(new_rung < rung[idx], np.where(aligned, rung[idx] - 1, rung[idx]), new_rung)
+            rung[idx] = new_rung
+            length[idx] = 2**(levels - new_rung)
+            start[idx] = tick
+            state.vel[idx] += .5 * a1 * (length[idx] * tick_dt)[:, None] # opening half kick of the next step
+
+        self.dt = max_dt
+        return max_dt
+
+    def interaction_acc(self, state, pos): # planet-planet accelerations with the central body left out
+        mass = state.mass.copy()
+        mass[np.argmax(mass)] = 0.0
+        return self.accelerations(state.replace(pos=pos, mass=mass))
+
+    def changeover(self, r, r_crit): # Chambers' (1999) switch: 0 within .1 r_crit, 1 beyond r_crit, smooth between
+        y = np.clip((r - .1 * r_crit) / (.9 * r_crit), 0.0, 1.0)
+        return y * y / (2 * y * y - 2 * y + 1)
+
+    def critical_radii(self, state, c): # changeover_hill Hill radii of every body on its osculating orbit about c
+        # computed once per set of bodies, so both kicks and the drift of every step split each pair the same way
+        cache = self._changeover
+        if cache is not None and np.array_equal(cache[0], state.mass):
+            return cache[1]
+        mass = state.mass
+        Q = state.pos - state.pos[c]
+        r = np.linalg.norm(Q, axis=1)
+        v2 = np.sum((state.vel - state.vel[c])**2, axis=1)
+        with np.errstate(divide='ignore'):
+            a = 1 / (2 / r - v2 / (G * (mass[c] + mass)))
+        a = np.where(a > 0, a, r) # unbound orbits: their current distance
+        r_crit = changeover_hill * a * np.cbrt(mass / (3 * mass[c]))
+        r_crit[c] = 0.0
+        self._changeover = (mass.copy(), r_crit)
+        return r_crit
+
+    def close_pairs(self, p0, p1, r_crit, c): # (i, j, r_crit of the pair) for pairs within their critical distance on the way from p0 to p1
+        first, second = sweep_and_prune(*swept_boxes(p0, p1, r_crit))
+        reach = np.maximum(r_crit[first], r_crit[second])
+        close = swept_contact(p0[second] - p0[first], p1[second] - p1[first], reach) & (first != c) & (second != c)
+        return first[close], second[close], reach[close]
+
+    def changeover_acc(self, state, Q, r_crit, c): # interaction_acc with the (1 - K) share of every close pair taken out
+        acc = self.interaction_acc(state, Q)
+        i, j, reach = self.close_pairs(Q, Q, r_crit, c)
+        if len(i):
+            d = Q[j] - Q[i]
+            r2 = np.einsum('ij,ij->i', d, d)
+            r = np.sqrt(r2)
+            w = (1 - self.changeover(r, reach)) * self.force_calc.G / (r * (r2 + eps**2))
+            np.add.at(acc, i, -(w * state.mass[j])[:, None] * d)
+            np.add.at(acc, j, (w * state.mass[i])[:, None] * d)
+        return acc
+
+    def encounter_drift(self, Q, V, mass, r_crit, m0, dt): # Kepler motion plus the (1 - K) share of the mutual pulls, on Dormand-Prince
+        # Q, V, mass, r_crit: the bodies of the close pairs only, so an encounter costs substeps of those few bodies
+        reach = np.maximum(r_crit[:, None], r_crit[None, :])
+
+        def accel(pos, t):
+            r0 = np.linalg.norm(pos, axis=1)
+            d = pos[None, :, :] - pos[:, None, :] # [i, j] points from i towards j
+            r2 = np.einsum('ijc,ijc->ij', d, d)
+            r = np.sqrt(r2)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                w = (1 - self.changeover(r, reach)) * self.force_calc.G * mass[None, :] / (r * (r2 + eps**2))
+            w[r == 0] = 0.0
+            return -G * m0 * pos / r0[:, None]**3 + np.einsum('ij,ijc->ic', w, d)
+
+        pos, vel, _, self.encounter_dt = self.rk_propagate(Q, V, accel(Q, 0.0), accel, dt, min(self.encounter_dt, dt))
+        return pos, vel
+
+    def wisdom_holman(self, state, hybrid=False): # democratic-heliocentric Wisdom-Holman map: kick, jump, Kepler drift, jump, kick
+        # hybrid: MERCURY's changeover (Chambers 1999); pairs that come within their critical distance keep only the
+        # K(r) share of their pull in the kicks and move on Dormand-Prince with the rest, everyone else on the Kepler drift
+        dt = self.dt
+        mass = state.mass
+        c = np.argmax(mass) # the dominant body everyone orbits
+        m0 = mass[c]
+        p = np.arange(len(state)) != c
+        M = mass.sum()
+
+        # to democratic heliocentric coordinates: heliocentric positions, barycentric velocities
+        x_cm = mass @ state.pos / M
+        v_cm = mass @ state.vel / M
+        Q = state.pos - state.pos[c]
+        V = state.vel - v_cm
+        if hybrid:
+            r_crit = self.critical_radii(state, c)
+            kick = lambda Q: self.changeover_acc(state, Q, r_crit, c)
+        else:
+            kick = lambda Q: self.interaction_acc(state, Q)
+
+        # 1) interaction kick, reusing the last closing kick when nothing moved since
+        cache = self._kick_cache
+        if cache is not None and np.array_equal(cache[0], state.pos) and np.array_equal(cache[1], mass):
+            a0 = cache[2]
+        else:
+            a0 = kick(Q)
+        V[p] += .5 * dt * a0[p]
+
+        # 2) linear drift from the central body's momentum
+        Q[p] += .5 * dt * (mass[p] @ V[p]) / m0
+
+        # 3) every planet along its own Kepler orbit about the central body
+        Q_start = Q.copy()
+        V_start = V.copy()
+        Q[p], V[p] = kepler_drift(Q[p], V[p], G * m0, dt)
+        if hybrid:
+            i, j, _ = self.close_pairs(Q_start, Q, r_crit, c)
+            group = np.union1d(i, j) # pairs that pass within r_crit somewhere along their Kepler arcs
+            if len(group):
+                Q[group], V[group] = self.encounter_drift(Q_start[group], V_start[group], mass[group], r_crit[group], m0, dt)
+
+        # 4)
+        Q[p] += .5 * dt * (mass[p] @ V[p]) / m0
+
+        # 5)
+        a1 = kick(Q)
+        V[p] += .5 * dt * a1[p]
+
+        # back to barycentric positions and velocities
+        x_c = x_cm + v_cm * dt - mass[p] @ Q[p] / M
+        state.pos[:] = Q + x_c
+        state.pos[c] = x_c
+        state.vel[:] = V + v_cm
+        state.vel[c] = v_cm - mass[p] @ V[p] / m0
+        state.acc_valid = False # acc was not updated; the full-force integrators recompute it
+        self._kick_cache = (state.pos.copy(), state.mass.copy(), a1)
+        return dt
+
+    def mercury(self, state):
+        return self.wisdom_holman(state, hybrid=True)
+
+    def test_step(self, tests, state, positions, taken): # massless bodies follow the massive ones across their step
+        # O(N_massive x N_test) per force pass: the test particles only ever appear as targets;
+        # positions(t) gives the massive bodies' positions t seconds into the step
+        def accel(pos, t):
+            return self.field_at(pos, state.replace(pos=positions(t)))
+
+        a0 = tests.acc if tests.acc_valid else accel(tests.pos, 0.0)
+        self.test_knots = [(0.0, tests.pos.copy(), tests.vel.copy())] # the path actually taken, for swept collisions and events
+        tests.pos[:], tests.vel[:], tests.acc[:], self.test_dt = self.rk_propagate(tests.pos, tests.vel, a0, accel, taken, self.test_dt, self.test_knots)
+        tests.acc_valid = True
+        self._test_sources = (positions(taken).copy(), state.mass.copy()) # where the massive bodies end the step
+
+    def test_acc_current(self, tests, state): # the test particles' last closing field still holds if the massive bodies are where it saw them
+        # independent of state.acc_valid: wisdom_holman and ephemeris_step never refresh state.acc, but their end positions are exact
+        sources = self._test_sources
+        return tests.acc_valid and sources is not None and np.array_equal(sources[0], state.pos) and np.array_equal(sources[1], state.mass)
+
+    def ephemeris_step(self, state, tests): # massive bodies are read off self.ephemeris; only the test particles are integrated
+        # callers check their end time against ephemeris.t_end up front; the last step is cut short to land on it
+        t0 = self.time
+        taken = min(self.dt, self.ephemeris.t_end - t0)
+        if taken <= 0:
+            raise ValueError(f"t = {t0:.0f} s is at or past the end of the ephemeris at {self.ephemeris.t_end:.0f} s")
+        rows = np.array([self.ephemeris.row[body.name] for body in state.bodies], dtype=int)
+
+        if tests is not None and len(tests):
+            tests.acc_valid = self.test_acc_current(tests, state)
+            self.test_step(tests, state, lambda t: self.ephemeris.position(t0 + t, rows), taken)
+        state.pos[:] = self.ephemeris.position(t0 + taken, rows)
+        state.vel[:] = self.ephemeris.velocity(t0 + taken, rows)
+        state.acc_valid = False
+        return taken
+
+    def step(self, state, tests=None):
+        self.test_knots = None
+        if self.ephemeris is not None:
+            self.time += self.ephemeris_step(state, tests)
+            self.steps += 1
+            return
+
+        advance, adaptive = INTEGRATORS[self.method]
+
+        if tests is not None and len(tests):
+            p0 = state.pos.copy() # start of the massive step, for interpolating the field the test particles see
+            v0 = state.vel.copy()
+            tests.acc_valid = self.test_acc_current(tests, state) # tests.acc is stale if the massive bodies were touched
+
+        taken = advance(self, state)
+
+        if tests is not None and len(tests):
+            self.test_step(tests, state, lambda t: hermite(p0, v0, state.pos, state.vel, taken, t / taken), taken)
 
-    def step(self, objects):
-        self.velocity_verlet(objects)
         self.steps += 1
-        self.time += self.dt
+        self.time += taken
+        if adaptive:
+            t0 = time.perf_counter() if self.stats is not None else 0.0
+            self.adaptive_dt(state) # sets the dt of the next step
+            if self.stats is not None:
+                self.stats.add("adaptive_dt", time.perf_counter() - t0)
+
+# symplectic composition weights (Yoshida 1990; Forest & Ruth 1990)
+YOSHIDA4 = (1 / (2 - 2**(1/3)), -2**(1/3) / (2 - 2**(1/3)), 1 / (2 - 2**(1/3)))
+_w1, _w2, _w3 = -1.17767998417887, 0.235573213359357, 0.784513610477560 # Yoshida's 6th-order solution A
+YOSHIDA6 = (_w3, _w2, _w1, 1 - 2 * (_w1 + _w2 + _w3), _w1, _w2, _w3)
+FOREST_RUTH = 1 / (2 - 2**(1/3))
+
+# Dormand-Prince 5(4) tableau
+DOPRI_C = (0, 1/5, 3/10, 4/5, 8/9, 1, 1)
+DOPRI_A = (
+    (),
+    (1/5,),
+    (3/40, 9/40),
+    (44/45, -56/15, 32/9),
+    (19372/6561, -25360/2187, 64448/6561, -212/729),
+    (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+    (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84),
+)
+DOPRI_E = tuple(b - b_star for b, b_star in zip( # 5th- minus 4th-order weights
+    (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0),
+    (5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40)))
+
+INTEGRATORS = { # name -> (step function, dt set by adaptive_dt afterwards)
+    "euler": (Integrator.euler, True),
+    "velocity_verlet": (Integrator.velocity_verlet, True),
+    "yoshida4": (Integrator.yoshida4, True),
+    "yoshida6": (Integrator.yoshida6, True),
+    "forest_ruth": (Integrator.forest_ruth, True),
+    "dormand_prince": (Integrator.dormand_prince, False), # embedded error estimate picks its own dt
+    "block": (Integrator.block_step, False), # per-body power-of-two steps within a base step of max_dt
+    "wisdom_holman": (Integrator.wisdom_holman, False), # fixed dt, Sun-dominated systems
+    "mercury": (Integrator.mercury, False), # wisdom_holman with close encounters handed to Dormand-Prince
+}
 
 # FORCE
 class ForceCalculator:
-    def __init__(self, G, mass_threshold):
+    def __init__(self, G, mass_threshold, tile_size=512):
         self.G = G
         self.mass_threshold = mass_threshold
+        self.tile_size = tile_size # bodies per tile edge; bounds the pair arrays to tile_size**2 entries
+
+    def accelerations(self, state): # every body's acceleration in one batched, tiled pass
+        acc = np.zeros((len(state), 3))
+        src_mass = np.where(state.mass >= self.mass_threshold, state.mass, 0.0) # bodies below the threshold exert no force
+        self.pair_tiles(state.pos, src_mass, acc, range(0, len(state), self.tile_size))
+        return acc
+
+    def pair_tiles(self, pos, src_mass, acc, row_starts): # adds the upper-triangular tiles of the given row blocks into acc
+        n = len(pos)
+        tile = self.tile_size
+
+        for i0 in row_starts:
+            i1 = min(i0 + tile, n)
+            for j0 in range(i0, n, tile): # upper-triangular tiles only, so each pair is visited once
+                j1 = min(j0 + tile, n)
+
+                # one (i, j) array per axis; separation points from i towards j
+                r_vec = [pos[None, j0:j1, k] - pos[i0:i1, None, k] for k in range(3)]
+                r2 = r_vec[0]**2 + r_vec[1]**2 + r_vec[2]**2
+                r = np.sqrt(r2)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    w = self.G / (r * (r2 + eps**2)) # G / (r (r^2 + eps^2)), same softening as gravity_force
+                w[r == 0] = 0.0 # skips self and coincident pairs
+                if i0 == j0:
+                    w = np.triu(w, k=1) # diagonal tile: keep j > i only
+
+                # Newton's third law: the same pair term pulls i towards j and j towards i
+                w_i = w * src_mass[None, j0:j1]
+                w_j = w * src_mass[i0:i1, None]
+                for k in range(3):
+                    acc[i0:i1, k] += np.einsum('ij,ij->i', w_i, r_vec[k])
+                    acc[j0:j1, k] -= np.einsum('ij,ij->j', w_j, r_vec[k])
+
+    def field_at(self, points, state): # acceleration at arbitrary points from the state's sources, no back-reaction
+        source = state.mass >= self.mass_threshold
+        acc = np.zeros((len(points), 3))
+        self.field_rows(points, state.pos[source], state.mass[source], acc, 0, len(points))
+        return acc
+
+    def field_rows(self, points, src_pos, src_mass, acc, start, stop): # adds the field at points[start:stop] into acc
+        tile = self.tile_size
+        target_tile = max(tile, tile * tile // max(len(src_pos), 1)) # few sources (e.g. planets acting on test particles) -> long target tiles
+
+        for i0 in range(start, stop, target_tile):
+            i1 = min(i0 + target_tile, stop)
+            for j0 in range(0, len(src_pos), tile):
+                j1 = min(j0 + tile, len(src_pos))
+
+                r_vec = [src_pos[None, j0:j1, k] - points[i0:i1, None, k] for k in range(3)]
+                r2 = r_vec[0]**2 + r_vec[1]**2 + r_vec[2]**2
+                r = np.sqrt(r2)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    w = self.G * src_mass[None, j0:j1] / (r * (r2 + eps**2))
+                w[r == 0] = 0.0
+
+                for k in range(3):
+                    acc[i0:i1, k] += np.einsum('ij,ij->i', w, r_vec[k])
+
+    def accelerations_of(self, state, idx): # accelerations of a subset of bodies, for block timesteps
+        return self.field_at(state.pos[idx], state)
+
+    def interactions(self, targets, state): # target-source pairs of the last pass over targets, for Stats
+        return targets * int(np.count_nonzero(state.mass >= self.mass_threshold))
+
+    def potentials(self, state): # gravitational potential at every body from the sources, tiled like accelerations
+        pos = state.pos
+        n = len(pos)
+        phi = np.zeros(n)
+        src_mass = np.where(state.mass >= self.mass_threshold, state.mass, 0.0)
+        tile = self.tile_size
+
+        for i0 in range(0, n, tile):
+            i1 = min(i0 + tile, n)
+            for j0 in range(i0, n, tile):
+                j1 = min(j0 + tile, n)
+                r2 = sum((pos[None, j0:j1, k] - pos[i0:i1, None, k])**2 for k in range(3))
+                with np.errstate(divide='ignore'):
+                    w = np.where(r2 > 0, -self.G / np.sqrt(r2), 0.0) # coincident bodies (and self) add nothing instead of -inf
+                if i0 == j0:
+                    w = np.triu(w, k=1)
+                phi[i0:i1] += w @ src_mass[j0:j1]
+                phi[j0:j1] += src_mass[i0:i1] @ w
+        return phi
     
     def gravity_force(self, target_object, other_objects): # calculates the total force on a body
         total_force = np.array([0.0, 0.0, 0.0])
@@ -135,52 +620,362 @@ class ForceCalculator:
     def accel_calc(self, obj, objects):
         return self.gravity_force(obj, objects) / obj.mass
 
+class TreeForceCalculator(ForceCalculator): # Barnes-Hut octree with monopole + quadrupole node moments
+    def __init__(self, G, mass_threshold, theta=θ, leaf_size=8, quadrupole=True):
+        super().__init__(G, mass_threshold)
+        self.theta = theta
+        self.leaf_size = leaf_size
+        self.quadrupole = quadrupole
+        self.tree = None
+        self.tree_builds = 0
+        self.walked = False # whether the last pass walked the tree or took the direct field_at
+        self._tree_pos = None
+        self._tree_mass = None
+
+    def build_tree(self, state): # rebuilds only when positions or masses changed since the last build
+        if (self.tree is not None and np.array_equal(state.pos, self._tree_pos)
+                and np.array_equal(state.mass, self._tree_mass)):
+            return self.tree
+
+        source = state.mass >= self.mass_threshold
+        self.tree = Octree(state.pos[source], state.mass[source], self.leaf_size)
+        self._tree_pos = state.pos.copy()
+        self._tree_mass = state.mass.copy()
+        self.tree_builds += 1
+        return self.tree
+
+    def accelerations(self, state):
+        tree = self.build_tree(state)
+        self.walked = True
+        return tree.accelerations(state.pos, self.G, self.theta, eps, self.quadrupole)
+
+    def accelerations_of(self, state, idx):
+        tree = self.build_tree(state)
+        self.walked = True
+        return tree.accelerations(state.pos[idx], self.G, self.theta, eps, self.quadrupole)
+
+    def field_at(self, points, state): # still the direct sum: the sources are few next to the targets, e.g. test particles
+        self.walked = False
+        return super().field_at(points, state)
+
+    def interactions(self, targets, state): # node and leaf-body interactions of the last tree walk, pairs after a direct pass
+        return self.tree.interactions if self.walked else super().interactions(targets, state)
+
+    def potentials(self, state): # tree-approximated potentials, from the tree the force passes already built
+        tree = self.build_tree(state)
+        return tree.accelerations(state.pos, self.G, self.theta, eps, self.quadrupole, potential=True)[1]
+
+    def force_error(self, state, sample=1000, seed=0): # relative acceleration error against the direct sum, on a sample of bodies
+        n = len(state)
+        idx = np.arange(n) if n <= sample else np.random.default_rng(seed).choice(n, sample, replace=False)
+
+        tree_acc = self.accelerations(state)[idx]
+        direct_acc = self.field_at(state.pos[idx], state)
+        err = np.linalg.norm(tree_acc - direct_acc, axis=1) / (np.linalg.norm(direct_acc, axis=1) + eps)
+        return {"median": np.median(err), "p99": np.percentile(err, 99), "max": np.max(err)}
+
+class ParallelForceCalculator(ForceCalculator): # direct sum with blocks of tiles spread over a persistent thread pool
+    # NumPy releases the GIL inside each tile's array operations, so threads share pos and mass without copies.
+    # accelerations: worker w takes row blocks w, w + W, ... of the symmetric kernel into its own buffer (pairs
+    # still visited once), and the buffers are summed; field_at: each worker writes a disjoint slice of rows
+    def __init__(self, G, mass_threshold, tile_size=512, workers=None):
+        super().__init__(G, mass_threshold, tile_size)
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=self.workers) # started once; steps only queue work on it
+
+    def field_at(self, points, state):
+        source = state.mass >= self.mass_threshold
+        src_pos = state.pos[source]
+        src_mass = state.mass[source]
+        acc = np.zeros((len(points), 3))
+        if len(points) * len(src_pos) < self.tile_size**2: # one tile of work; the pool would only add latency
+            self.field_rows(points, src_pos, src_mass, acc, 0, len(points))
+            return acc
+
+        rows = max(1, min(self.tile_size, -(-len(points) // (4 * self.workers)))) # a few blocks per worker to even out the load
+        jobs = [self.pool.submit(self.field_rows, points, src_pos, src_mass, acc, i0, min(i0 + rows, len(points)))
+                for i0 in range(0, len(points), rows)]
+        for job in jobs:
+            job.result() # re-raises a worker's exception here
+        return acc
+
+    def accelerations(self, state):
+        n = len(state)
+        src_mass = np.where(state.mass >= self.mass_threshold, state.mass, 0.0)
+        starts = range(0, n, self.tile_size)
+        stripes = min(self.workers, len(starts))
+        if stripes < 2:
+            return super().accelerations(state)
+
+        # round-robin stripes even out the triangle: early row blocks have the most tiles
+        buffers = [np.zeros((n, 3)) for _ in range(stripes)]
+        jobs = [self.pool.submit(self.pair_tiles, state.pos, src_mass, buffers[w], starts[w::stripes]) for w in range(stripes)]
+        for job in jobs:
+            job.result()
+        return np.sum(buffers, axis=0)
+
+FORCE_BACKENDS = {
+    "direct": ForceCalculator,
+    "tree": TreeForceCalculator,
+    "parallel": ParallelForceCalculator,
+}
+
 class CollisionHandler:
     def __init__(self):
         pass
 
     # COLLISION HANDLING
-    def collision_handling(self, objects):
-        to_remove = []
-
-        for i, obj1 in enumerate(objects): # pair up objects
-            for obj2 in objects[i+1:]:
-                if obj1 is obj2:
-                    continue
-
-                r = np.linalg.norm(obj1.pos - obj2.pos) # detect collision
-                if r <= (obj1.radius + obj2.radius):
-                    print(f"Collision: {obj1.name} hit {obj2.name}")
-                    
-
-                    if obj1.mass > obj2.mass:
-                        to_remove.append(obj2)
-                        obj1.mass += obj2.mass
-                        obj1.momentum += obj2.momentum
-                        obj1.vel = obj1.momentum/obj1.mass
-                        print(obj1.vel)
-                    elif obj1.mass < obj2.mass:
-                        to_remove.append(obj1)
-                        obj2.mass += obj1.mass
-                        obj2.momentum += obj1.momentum
-                        obj2.vel = obj2.momentum/obj2.mass
-                        print(obj2.vel)
-
-        for obj in to_remove:
-            if obj in objects:
-                objects.remove(obj)
+    def collision_handling(self, state, tests=None, start=None, test_knots=None):
+        # start is (pos, vel, h) of the massive bodies before a step of length h, and bodies move along the cubic Hermite
+        # between that and their end state; test_knots is the test particles' (time, pos, vel) at every substep from the
+        # start, as Integrator.test_knots records them. Without them only the end positions are checked
+        if start is None:
+            start = (state.pos, state.vel, 0.0)
+        if tests is not None and len(tests):
+            if test_knots is None:
+                test_knots = [(0.0, tests.pos, tests.vel), (start[2], tests.pos, tests.vel)]
+            self.test_particle_impacts(state, tests, start, test_knots)
+
+        objects = state.bodies
+        keep = np.ones(len(state), dtype=bool) # rows that survive this pass
+        p0, v0, h = start
+
+        # broad phase on the boxes around each body's path, narrow phase on the candidate pairs only
+        first, second = sweep_and_prune(*hermite_boxes(p0, v0, state.pos, state.vel, h, state.radius))
+        contact = hermite_contact(p0[second] - p0[first], v0[second] - v0[first], state.pos[second] - state.pos[first],
+                                  state.vel[second] - state.vel[first], h, state.radius[first] + state.radius[second])
+        first, second = first[contact], second[contact]
+        pairs = np.lexsort((second, first)) # same pair order as a nested i < j loop
+
+        # decide who absorbs whom in pair order with running masses, then apply every merge at once
+        mass = state.mass.copy()
+        absorbed_by = np.arange(len(state))
+        for i, j in zip(first[pairs], second[pairs]):
+            if not (keep[i] and keep[j]):
+                continue # already merged into something else this pass
+
+            print(f"Collision: {objects[i].name} hit {objects[j].name}")
+            if mass[i] > mass[j]:
+                big, small = i, j
+            elif mass[i] < mass[j]:
+                big, small = j, i
+            else:
+                continue
+
+            mass[big] += mass[small]
+            absorbed_by[small] = big
+            keep[small] = False
+
+        if not keep.all():
+            root = absorbed_by
+            while np.any(root[root] != root): # a body absorbed by one that was itself absorbed ends up in the last survivor
+                root = root[root]
+            momentum = np.zeros((len(state), 3))
+            np.add.at(momentum, root, state.mass[:, None] * state.vel) # momentum-conserving, as pairwise merges were
+            merged = np.unique(root[~keep])
+            state.mass[merged] = mass[merged]
+            state.vel[merged] = momentum[merged] / mass[merged, None]
+            for big in merged:
+                print(state.vel[big])
+            state.compact(keep) # drop merged rows in one pass
+
+    def test_particle_impacts(self, state, tests, start, test_knots): # test particles that touch a massive body are absorbed; being massless they leave it unchanged
+        # each test particle follows the Hermite between its substep knots, the massive bodies their one Hermite over the
+        # whole step evaluated at the same knots, so the relative motion is again a cubic on every substep
+        p0, v0, h = start
+        times = np.array([t for t, _, _ in test_knots])
+        t_pos = np.stack([x for _, x, _ in test_knots]) # (knots, tests, 3)
+        t_vel = np.stack([v for _, _, v in test_knots])
+        s = times / h if h > 0 else np.zeros(len(times))
+        m_pos = hermite(p0, v0, state.pos, state.vel, h, s) # (knots, massive, 3)
+        m_vel = hermite_velocity(p0, v0, state.pos, state.vel, h, s) if h > 0 else np.broadcast_to(state.vel, m_pos.shape)
+        sub = np.diff(times)
+
+        # boxes around every test particle's whole path: the union of its substeps' control-point hulls
+        c1 = t_pos[:-1] + t_vel[:-1] * (sub[:, None, None] / 3)
+        c2 = t_pos[1:] - t_vel[1:] * (sub[:, None, None] / 3)
+        t_lo = np.minimum(t_pos.min(axis=0), np.minimum(c1, c2).min(axis=0, initial=np.inf)) - tests.radius[:, None]
+        t_hi = np.maximum(t_pos.max(axis=0), np.maximum(c1, c2).max(axis=0, initial=-np.inf)) + tests.radius[:, None]
+        m_lo, m_hi = hermite_boxes(p0, v0, state.pos, state.vel, h, state.radius)
+
+        hit = np.zeros(len(tests), dtype=bool)
+        for j in range(len(state)): # candidates per massive body, then every substep of theirs in one narrow-phase call
+            near = np.flatnonzero(np.all((t_lo <= m_hi[j]) & (m_lo[j] <= t_hi), axis=1))
+            if len(near) == 0:
+                continue
+            d = t_pos[:, near] - m_pos[:, j, None]
+            u = t_vel[:, near] - m_vel[:, j, None]
+            k = len(sub)
+            reach = np.tile(tests.radius[near] + state.radius[j], max(k, 1))
+            if k == 0:
+                contact = np.linalg.norm(d[0], axis=1) <= reach
+            else:
+                contact = hermite_contact(d[:-1].reshape(-1, 3), u[:-1].reshape(-1, 3), d[1:].reshape(-1, 3), u[1:].reshape(-1, 3),
+                                          np.repeat(sub, len(near)), reach).reshape(k, -1).any(axis=0)
+            hit_j = np.zeros(len(tests), dtype=bool)
+            hit_j[near[contact]] = True
+            for i in np.flatnonzero(hit_j & ~hit):
+                print(f"Collision: {tests.bodies[i].name} hit {state.bodies[j].name}")
+            hit |= hit_j
+
+        if hit.any():
+            tests.compact(~hit)
+
+# PARTICLE STATE
+class ParticleState: # contiguous N x 3 / length-N arrays shared by every body in a world
+    columns = ("pos", "vel", "acc", "mass", "radius", "dt") # every per-row array, kept in step by add/compact
+
+    def __init__(self):
+        self.pos = np.zeros((0, 3))
+        self.vel = np.zeros((0, 3))
+        self.acc = np.zeros((0, 3))
+        self.mass = np.zeros(0)
+        self.radius = np.zeros(0)
+        self.dt = np.zeros(0) # per-body step for block timesteps, nan until assigned
+        self.bodies = [] # row i of every array belongs to bodies[i]
+        self.acc_valid = False # acc holds the accelerations of the current pos/mass
+
+    def __len__(self):
+        return len(self.bodies)
+
+    def add(self, bodies): # copies each body's values into the store and rebinds it as a view
+        bodies = list(bodies)
+        if not bodies:
+            return
+
+        for name in self.columns:
+            rows = [getattr(b.state, name)[b.index] for b in bodies]
+            setattr(self, name, np.concatenate([getattr(self, name), rows]))
+
+        for index, body in enumerate(bodies, start=len(self.bodies)):
+            body.state = self
+            body.index = index
+        self.bodies.extend(bodies)
+        self.acc_valid = False
+
+    def add_arrays(self, pos, vel, mass=0.0, radius=0.0, name="tp", color="#AAAAAA"): # bulk add of many anonymous bodies, e.g. test particles
+        n = len(pos)
+        start = len(self.bodies)
+        rows = {"pos": pos, "vel": vel, "acc": np.zeros((n, 3)), "mass": np.broadcast_to(mass, n),
+                "radius": np.broadcast_to(radius, n), "dt": np.full(n, np.nan)}
+        for column in self.columns:
+            setattr(self, column, np.concatenate([getattr(self, column), np.asarray(rows[column], dtype=float)]))
+
+        self.bodies.extend(CelestialBody.view(self, start + i, f"{name}{i}", color) for i in range(n))
+        self.acc_valid = False
+
+    def replace(self, **arrays): # shallow copy with some columns swapped, for force passes on trial positions or masses
+        other = ParticleState()
+        for name in self.columns:
+            setattr(other, name, arrays.get(name, getattr(self, name)))
+        other.bodies = self.bodies
+        return other
+
+    def subset(self, idx): # copy of the rows in idx, still pointing at the same body objects
+        other = ParticleState()
+        for name in self.columns:
+            setattr(other, name, getattr(self, name)[idx])
+        other.bodies = [self.bodies[i] for i in idx]
+        other.acc_valid = self.acc_valid
+        return other
+
+    def update(self, idx, other): # writes the rows of a subset back
+        for name in self.columns:
+            getattr(self, name)[idx] = getattr(other, name)
+
+    def compact(self, keep): # keep is a boolean mask over rows; removed bodies get their own copy
+        for body, k in zip(self.bodies, keep):
+            if not k:
+                body.detach()
+
+        for name in self.columns:
+            setattr(self, name, getattr(self, name)[keep])
+        self.bodies = [body for body, k in zip(self.bodies, keep) if k]
+
+        for index, body in enumerate(self.bodies):
+            body.index = index
+        self.acc_valid = False # merged masses and removed sources change everyone's acceleration
 
 # CELESTIAL BODY
-class CelestialBody:
-    def __init__(self, name, color, x, y, z, vx, vy, vz, mass, radius): # Body object properties
-        self.pos = np.array([x, y, z], dtype=float)
-        self.vel = np.array([vx, vy, vz], dtype=float)
-        self.acc = np.array([0.0, 0.0, 0.0])
-        self.mass = mass
-        self.radius = radius
+class CelestialBody: # lightweight view onto one row of a ParticleState
+    def __init__(self, name, color, x, y, z, vx, vy, vz, mass, radius, method=None): # Body object properties
         self.name = name
         self.color = color
-        self.momentum = self.vel * self.mass
+        self.method = method # None, or "dormand_prince" for a body below mass_threshold (a spacecraft), which World makes a test particle
+        self.state = ParticleState() # standalone until a World adopts it
+        self.index = 0
+        self.state.pos = np.array([[x, y, z]], dtype=float)
+        self.state.vel = np.array([[vx, vy, vz]], dtype=float)
+        self.state.acc = np.zeros((1, 3))
+        self.state.mass = np.array([mass], dtype=float)
+        self.state.radius = np.array([radius], dtype=float)
+        self.state.dt = np.array([np.nan])
+        self.state.bodies = [self]
+
+    @classmethod
+    def view(cls, state, index, name, color, method=None): # bind straight to an existing row, skipping the standalone store
+        body = cls.__new__(cls)
+        body.name = name
+        body.color = color
+        body.method = method
+        body.state = state
+        body.index = index
+        return body
+
+    def detach(self): # move this body's row into a private store so the view stays valid
+        i = self.index
+        store = ParticleState()
+        for name in store.columns:
+            setattr(store, name, getattr(self.state, name)[i:i + 1].copy())
+        store.bodies = [self]
+        self.state = store
+        self.index = 0
+
+    @property
+    def pos(self):
+        return self.state.pos[self.index]
+
+    @pos.setter
+    def pos(self, value):
+        self.state.pos[self.index] = value
+        self.state.acc_valid = False
+
+    @property
+    def vel(self):
+        return self.state.vel[self.index]
+
+    @vel.setter
+    def vel(self, value):
+        self.state.vel[self.index] = value
+
+    @property
+    def acc(self):
+        return self.state.acc[self.index]
+
+    @acc.setter
+    def acc(self, value):
+        self.state.acc[self.index] = value
+
+    @property
+    def mass(self):
+        return self.state.mass[self.index]
+
+    @mass.setter
+    def mass(self, value):
+        self.state.mass[self.index] = value
+        self.state.acc_valid = False
+
+    @property
+    def radius(self):
+        return self.state.radius[self.index]
+
+    @radius.setter
+    def radius(self, value):
+        self.state.radius[self.index] = value
+
+    @property
+    def momentum(self):
+        return self.vel * self.mass
 
 # ENVIRONMENT MANAGER
 class EnvironmentBuilder:
@@ -203,6 +998,19 @@ class EnvironmentBuilder:
         asteroid = CelestialBody("AsteroidX", "#AAAAAA", 1.1414738e+11 + 5e7, -9.98583366e+10 - 5e7, 2e7, -8000, 12000, 2000, 1e12, 500)
         self.objects.extend([sun, mercury, venus, earth, moon, mars, jupiter, saturn, uranus, neptune, pluto, halley, asteroid])
 
+    def horizons(self, epoch, client=None): # the HORIZONS_IDS bodies at any epoch, with the physical properties of solar_system()
+        from horizons import HorizonsClient # network code is only loaded for scenes that need it
+
+        reference = EnvironmentBuilder()
+        reference.solar_system()
+        properties = {body.name: body for body in reference.objects}
+
+        vectors = (client or HorizonsClient()).state_vectors(HORIZONS_IDS.values(), epoch)
+        for name, body_id in HORIZONS_IDS.items():
+            pos, vel = vectors[body_id]
+            template = properties[name]
+            self.objects.append(CelestialBody(name, template.color, *pos, *vel, template.mass, template.radius))
+
     def momentum_test(self):
         m1 = CelestialBody("m1", "#FF0000", 0, 0, 0, 0, 0, 0, 10, 1)
         m2 = CelestialBody("m2", "#0000FF", 10, 0, 0, -1, 0, 0, 5, 1)
@@ -212,67 +1020,148 @@ class EnvironmentBuilder:
 # WORLD MANAGER
 class World: # "scene manager"
     def __init__(self, integrator, force_calculator, environment_builder, collision_handler):
-        self.objects = []
+        self.state = ParticleState() # massive bodies
+        self.tests = ParticleState() # test particles: feel the massive bodies, never act as sources
         self.integrator = integrator
         self.force_calculator = force_calculator
         self.environment_builder = environment_builder
         self.collision_handler = collision_handler
+        self.trails = None # optional Trails of the massive bodies, sampled at its own simulated-time cadence
+        self.diagnostics = None # optional Diagnostics of the massive bodies, likewise
+        self.events = None # optional Events, located on the dense output of every step
+        self.stats = None # optional Stats of the step's phases; see instrument()
+
+    @property
+    def objects(self): # body views, massive bodies first, each group in the order of its rows
+        return self.state.bodies + self.tests.bodies
 
-    def load_environment(self):
-        self.environment_builder.solar_system()
-        self.objects = self.environment_builder.objects
+    def add(self, bodies): # bodies below mass_threshold exert no force anyway, so they become test particles
+        # test particles are always integrated on Dormand-Prince; a massive body follows the Integrator's method, since
+        # one stepped apart from the rest would not pull on them during the step
+        bodies = list(bodies)
+        threshold = self.force_calculator.mass_threshold
+        for body in bodies:
+            if body.method is not None and body.mass >= threshold:
+                raise ValueError(f"{body.name}: a per-body method is only allowed below mass_threshold ({threshold:g} kg)")
+            if body.method not in (None, "dormand_prince"):
+                raise ValueError(f"{body.name}: test particles are integrated on 'dormand_prince', not {body.method!r}")
+        self.state.add([body for body in bodies if body.mass >= threshold])
+        self.tests.add([body for body in bodies if body.mass < threshold])
+
+    def add_test_particles(self, pos, vel, radius=0.0, name="tp", color="#AAAAAA"): # many spacecraft or asteroids at once
+        self.tests.add_arrays(pos, vel, 0.0, radius, name, color)
+
+    def prescribe(self, ephemeris): # massive bodies follow the ephemeris from now on; the rest are integrated against it
+        # massive bodies the ephemeris does not cover become test particles, so nothing integrated pulls on anything
+        uncovered = np.array([body.name not in ephemeris for body in self.state.bodies], dtype=bool)
+        if uncovered.any():
+            moved = [body for body, u in zip(self.state.bodies, uncovered) if u]
+            self.state.compact(~uncovered)
+            self.tests.add(moved)
+
+        self.integrator.ephemeris = ephemeris
+        rows = np.array([ephemeris.row[body.name] for body in self.state.bodies], dtype=int)
+        self.state.pos[:] = ephemeris.position(self.integrator.time, rows)
+        self.state.vel[:] = ephemeris.velocity(self.integrator.time, rows)
+        self.state.acc_valid = False
+
+    def load_environment(self, scenario="solar_system", **options): # scenario is any EnvironmentBuilder method, options its arguments
+        getattr(self.environment_builder, scenario)(**options)
+        self.add(self.environment_builder.objects)
     
+    def instrument(self, stats): # times every step's phases into stats; None switches it off again
+        self.stats = stats
+        self.integrator.stats = stats
+
     def step(self):
-        self.integrator.step(self.objects)
-        self.collision_handler.collision_handling(self.objects)
-        self.integrator.adaptive_dt(self.objects)
+        stats = self.stats
+        start_pos = self.state.pos.copy() # for swept collision checks across the step
+        start_vel = self.state.vel.copy()
+        t0 = self.integrator.time
+        if stats is not None:
+            stats.mark()
+        if self.events is not None:
+            self.events.begin(self)
+        self.integrator.step(self.state, self.tests)
+        if stats is not None:
+            stats.lap("integrator")
+        if self.events is not None:
+            self.events.detect(self) # before collisions can merge away the rows it interpolates
+            if stats is not None:
+                stats.lap("events")
+        self.collision_handler.collision_handling(self.state, self.tests, (start_pos, start_vel, self.integrator.time - t0),
+                                                  self.integrator.test_knots)
+        if stats is not None:
+            stats.lap("collisions")
+        if self.trails is not None:
+            self.trails.record(self.integrator.time, self.state)
+            if stats is not None:
+                stats.lap("trails")
+        if self.diagnostics is not None:
+            self.diagnostics.record(self.integrator.time, self.state, self.integrator.steps)
+            if stats is not None:
+                stats.lap("diagnostics")
+        if stats is not None:
+            stats.step(self.integrator.time, self.integrator.dt)
 
 
 # INSTANTIATION
 environment_builder = EnvironmentBuilder()
-force_calculator = ForceCalculator(G=G, mass_threshold=mass_threshold)
+force_calculator = FORCE_BACKENDS[force_backend](G=G, mass_threshold=mass_threshold)
 collision_handler = CollisionHandler()
 integrator = Integrator(dt=dt, force_calc=force_calculator)
 world = World(integrator, force_calculator, environment_builder, collision_handler)
 
 
 # ENERGY
-def total_energy(): # takes a "snapshot" of the system's energy when called
-    KE = 0.0
-    PE = 0.0
-
-    for object in world.objects:
-        KE += .5 * object.mass * (np.linalg.norm(object.vel) ** 2)
-    for index, obj1 in enumerate(world.objects):
-        for obj2 in world.objects[index + 1:]:
-            distance = np.linalg.norm(obj1.pos - obj2.pos)
-            PE += -(G * obj1.mass * obj2.mass) / distance
+def total_energy(objects=None): # takes a "snapshot" of the system's energy when called
+    # every pair counts whatever its mass, as before; see diagnostics.py for momentum, angular momentum and time series
+    if objects is None:
+        objects = world.objects
+    state = ParticleState()
+    state.pos = np.array([obj.pos for obj in objects], dtype=float).reshape(-1, 3)
+    state.mass = np.array([obj.mass for obj in objects], dtype=float)
+    vel = np.array([obj.vel for obj in objects], dtype=float).reshape(-1, 3)
+
+    KE = .5 * state.mass @ np.einsum('ij,ij->i', vel, vel)
+    PE = .5 * state.mass @ ForceCalculator(G, 0.0).potentials(state) # each pair is in two bodies' potentials
     energy = KE + PE
     return energy
 
 
-world.load_environment()
-renderer = PygameRenderer(scale)
-energy_i = total_energy()
+if __name__ == "__main__":
+    from render import PygameRenderer # pygame is only needed for the interactive viewer; see astro_engine.py for headless runs
+    from trails import Trails
+    from stats import Stats
 
-# SIMULATION LOOP
-running = True
-while running and world.integrator.steps < steps:
-    running = renderer.handle_events(world.objects)
-    world.step()
+    world.load_environment()
+    world.trails = Trails(len(world.state))
+    stats = Stats(interval=.5) # shown with i; rendering is timed in here too
+    world.instrument(stats)
+    renderer = PygameRenderer(scale)
+    energy_i = total_energy()
 
-    # RENDERING
-    if world.integrator.steps % render_step == 0:
-        # Pass the total simulation time, not just the current timestep
-        renderer.draw(world.objects, world.integrator.time)
-    
-    renderer.clock.tick(fps_limit)
+    # SIMULATION LOOP
+    running = True
+    while running and world.integrator.steps < steps:
+        running = renderer.handle_events(world.objects)
+        world.step()
+
+        # RENDERING
+        if world.integrator.steps % render_step == 0:
+            # Pass the total simulation time, not just the current timestep
+            renderer.draw(world.objects, world.integrator.time, trails=world.trails)
+            stats.add("render", renderer.draw_seconds)
+        if time.perf_counter() >= stats.next_report:
+            renderer.stats = stats.report()
+        
+        renderer.clock.tick(fps_limit)
 
 
 
-renderer.quit()
+    renderer.quit()
 
-# OUTPUT
-energy_f = total_energy()
-print(f"Final energy error: {(np.abs(energy_f-energy_i)/np.abs(energy_i))*100:.2e}% ")
+    # OUTPUT
+    energy_f = total_energy()
+    print(f"Final energy error: {(np.abs(energy_f-energy_i)/np.abs(energy_i))*100:.2e}% ")
 
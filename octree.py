@@ -0,0 +1,223 @@
+# IMPORTS
+import numpy as np
+
+# CONSTANTS/SETTINGS
+MAX_DEPTH = 21 # bits per axis in a Morton key, 3 * 21 = 63 fits in a uint64
+
+
+def _spread_bits(v): # put two zero bits between each of the low 21 bits of v
+    v = v.astype(np.uint64) & np.uint64(0x1fffff)
+    v = (v | v << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+    v = (v | v << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+    v = (v | v << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+    v = (v | v << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | v << np.uint64(2)) & np.uint64(0x1249249249249249)
+    return v
+
+
+def _morton_keys(pos): # 63-bit Morton keys of pos inside its own bounding cube, with that cube and the deepest-level cells
+    lo = pos.min(axis=0) if len(pos) else np.zeros(3)
+    hi = pos.max(axis=0) if len(pos) else np.zeros(3)
+    half = max(np.max(hi - lo) / 2 * (1 + 1e-9), 1.0) # root cube half-width, never zero
+    corner = (lo + hi) / 2 - half
+    # integer cell coordinates at the deepest level -> interleaved Morton keys
+    cells = np.clip(np.floor((pos - corner) / (2 * half) * 2**MAX_DEPTH).astype(np.int64), 0, 2**MAX_DEPTH - 1)
+    keys = _spread_bits(cells[:, 0]) | _spread_bits(cells[:, 1]) << np.uint64(1) | _spread_bits(cells[:, 2]) << np.uint64(2)
+    return keys, corner, half, cells
+
+
+def _ranges(starts, counts): # concatenation of np.arange(s, s + c) for every (s, c) pair, without a Python loop
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(counts.sum())
+
+
+# OCTREE
+class Octree: # linear (Morton-ordered) octree over the source bodies with monopole + quadrupole moments
+    def __init__(self, pos, mass, leaf_size=8):
+        n = len(pos)
+        keys, corner, half, cells = _morton_keys(pos)
+
+        self.order = np.argsort(keys, kind='stable') # sorted slot -> source index
+        keys = keys[self.order]
+        cells = cells[self.order]
+        self.pos = pos[self.order]
+        self.mass = mass[self.order]
+
+        # NODES (built level by level; every node owns a contiguous run of sorted bodies)
+        starts, counts, levels, parents = [np.array([0])], [np.array([n])], [np.array([0])], [np.array([-1])]
+        split = np.array([0]) if n > leaf_size else np.array([], dtype=int)
+        n_nodes = 1
+
+        for level in range(1, MAX_DEPTH + 1):
+            if len(split) == 0:
+                break
+
+            p_start = np.concatenate(starts)[split]
+            p_count = np.concatenate(counts)[split]
+            idx = _ranges(p_start, p_count)
+            prefix = keys[idx] >> np.uint64(3 * (MAX_DEPTH - level))
+
+            first = np.flatnonzero(np.r_[True, prefix[1:] != prefix[:-1]]) # a new child starts wherever the prefix changes
+            seg_count = np.diff(np.r_[first, len(idx)])
+            seg_parent = split[np.searchsorted(np.cumsum(p_count), first, side='right')]
+
+            starts.append(idx[first])
+            counts.append(seg_count)
+            levels.append(np.full(len(first), level))
+            parents.append(seg_parent)
+
+            ids = n_nodes + np.arange(len(first))
+            split = ids[(seg_count > leaf_size) & (level < MAX_DEPTH)]
+            n_nodes += len(first)
+
+        self.start = np.concatenate(starts)
+        self.count = np.concatenate(counts)
+        self.level = np.concatenate(levels)
+        parent = np.concatenate(parents)
+
+        # children of a node are contiguous, so (first child, child count) is enough to descend
+        self.child_count = np.bincount(parent[1:], minlength=n_nodes)
+        self.child_first = np.full(n_nodes, -1)
+        is_first = np.r_[True, np.diff(parent[1:]) != 0][:n_nodes - 1]
+        self.child_first[parent[1:][is_first]] = np.arange(1, n_nodes)[is_first]
+
+        # node geometry from the cell of the node's first body
+        self.half = half / 2.0**self.level
+        node_cell = cells[self.start] >> (MAX_DEPTH - self.level)[:, None] if n else np.zeros((1, 3), dtype=np.int64)
+        self.center = corner + (node_cell + .5) * (2 * self.half)[:, None]
+
+        # MOMENTS
+        idx = _ranges(self.start, self.count)
+        owner = np.repeat(np.arange(n_nodes), self.count)
+        m = self.mass[idx]
+        self.M = np.bincount(owner, m, minlength=n_nodes)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            com = np.stack([np.bincount(owner, m * self.pos[idx, k], minlength=n_nodes) for k in range(3)], axis=1) / self.M[:, None]
+        self.com = np.where(self.M[:, None] > 0, com, self.center)
+
+        d = self.pos[idx] - self.com[owner]
+        d2 = np.sum(d * d, axis=1)
+        # traceless quadrupole Q_ab = sum m (3 d_a d_b - |d|^2 delta_ab), stored as xx, yy, zz, xy, xz, yz
+        self.Q = np.stack([
+            np.bincount(owner, m * (3 * d[:, 0] * d[:, 0] - d2), minlength=n_nodes),
+            np.bincount(owner, m * (3 * d[:, 1] * d[:, 1] - d2), minlength=n_nodes),
+            np.bincount(owner, m * (3 * d[:, 2] * d[:, 2] - d2), minlength=n_nodes),
+            np.bincount(owner, m * 3 * d[:, 0] * d[:, 1], minlength=n_nodes),
+            np.bincount(owner, m * 3 * d[:, 0] * d[:, 2], minlength=n_nodes),
+            np.bincount(owner, m * 3 * d[:, 1] * d[:, 2], minlength=n_nodes),
+        ], axis=1)
+
+        # opening radius: side / theta, padded by how far the mass centre sits from the geometric centre
+        self.offset = np.linalg.norm(self.com - self.center, axis=1)
+
+    def __len__(self):
+        return len(self.start)
+
+    def accelerations(self, points, G, theta, eps, quadrupole=True, group_size=8, chunk=256, potential=False):
+        # targets are Morton-sorted and walked through the tree in groups of group_size, so the opening
+        # test runs once per (group, node) instead of once per (target, node); with potential=True the
+        # gravitational potential at every point comes back too, from the same walk
+        n_p = len(points)
+        acc = np.zeros((3, n_p))
+        phi = np.zeros(n_p)
+        self.interactions = 0
+        if len(self.pos) == 0 or n_p == 0:
+            return (acc.T.copy(), phi) if potential else acc.T.copy()
+
+        order = np.argsort(_morton_keys(points)[0], kind='stable')
+        p = points[order].T.copy() # (3, n_p), rows are x, y, z
+
+        g_start = np.arange(0, n_p, group_size)
+        g_count = np.minimum(group_size, n_p - g_start)
+        lo = np.minimum.reduceat(p, g_start, axis=1)
+        hi = np.maximum.reduceat(p, g_start, axis=1)
+        g_center = (lo + hi) / 2
+        g_half = (hi - lo) / 2
+
+        com, center, Q, src = self.com.T, self.center.T, self.Q.T, self.pos.T
+
+        for c0 in range(0, len(g_start), chunk): # a chunk of groups bounds the size of the pair arrays
+            g = np.arange(c0, min(c0 + chunk, len(g_start)))
+            nd = np.zeros(len(g), dtype=int)
+            t0 = g_start[c0]
+            n_t = g_start[g[-1]] + g_count[g[-1]] - t0
+            far, near = [], []
+
+            # 1) WALK: open nodes until each is far enough from the whole group, or is a leaf
+            while len(g):
+                gap = np.maximum(np.abs(com[:, nd] - g_center[:, g]) - g_half[:, g], 0.0) # mass centre to group box
+                dist = np.sqrt(gap[0]**2 + gap[1]**2 + gap[2]**2)
+                overlap = np.all(np.abs(center[:, nd] - g_center[:, g]) <= self.half[nd] + g_half[:, g], axis=0)
+                accept = ~overlap & (dist * theta > 2 * self.half[nd] + theta * self.offset[nd])
+                leaf = self.child_count[nd] == 0
+
+                far.append((g[accept], nd[accept]))
+                near.append((g[~accept & leaf], nd[~accept & leaf]))
+
+                opened = ~accept & ~leaf
+                no = nd[opened]
+                g = np.repeat(g[opened], self.child_count[no])
+                nd = _ranges(self.child_first[no], self.child_count[no])
+
+            a = np.zeros((3, n_t))
+            ph = np.zeros(n_t)
+
+            # 2) FAR: multipole expansion about each node's mass centre, one row per (target, node)
+            gf = np.concatenate([f[0] for f in far])
+            nf = np.concatenate([f[1] for f in far])
+            tt = _ranges(g_start[gf], g_count[gf])
+            nn = np.repeat(nf, g_count[gf])
+            r = p[:, tt] - com[:, nn] # from node mass centre to target
+            r2 = r[0]**2 + r[1]**2 + r[2]**2
+            r1 = np.sqrt(r2)
+            contrib = r * (-G * self.M[nn] / (r1 * (r2 + eps**2)))
+            if quadrupole:
+                q = Q[:, nn]
+                Qr = np.stack([
+                    q[0] * r[0] + q[3] * r[1] + q[4] * r[2],
+                    q[3] * r[0] + q[1] * r[1] + q[5] * r[2],
+                    q[4] * r[0] + q[5] * r[1] + q[2] * r[2],
+                ])
+                r5 = r2 * r2 * r1
+                rQr = r[0] * Qr[0] + r[1] * Qr[1] + r[2] * Qr[2]
+                contrib += G * (Qr / r5 - r * (2.5 * rQr / (r5 * r2)))
+            for k in range(3):
+                a[k] += np.bincount(tt - t0, contrib[k], minlength=n_t)
+            if potential:
+                node_phi = -G * self.M[nn] / r1
+                if quadrupole:
+                    node_phi -= G * rQr / (2 * r5)
+                ph += np.bincount(tt - t0, node_phi, minlength=n_t)
+            self.interactions += len(tt)
+
+            # 3) NEAR: direct sum over the bodies held by leaves the group could not accept
+            gl = np.concatenate([f[0] for f in near])
+            nl = np.concatenate([f[1] for f in near])
+            tt = _ranges(g_start[gl], g_count[gl])
+            nn = np.repeat(nl, g_count[gl])
+            jj = _ranges(self.start[nn], self.count[nn])
+            tt = np.repeat(tt, self.count[nn])
+            d = src[:, jj] - p[:, tt] # from target towards source
+            d2 = d[0]**2 + d[1]**2 + d[2]**2
+            d1 = np.sqrt(d2)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                w = G * self.mass[jj] / (d1 * (d2 + eps**2))
+            w[d1 == 0] = 0.0 # skips the target itself and coincident bodies
+            for k in range(3):
+                a[k] += np.bincount(tt - t0, w * d[k], minlength=n_t)
+            if potential:
+                with np.errstate(divide='ignore'):
+                    pair_phi = np.where(d1 > 0, -G * self.mass[jj] / d1, 0.0)
+                ph += np.bincount(tt - t0, pair_phi, minlength=n_t)
+            self.interactions += len(tt)
+
+            acc[:, t0:t0 + n_t] = a
+            phi[t0:t0 + n_t] = ph
+
+        out = np.empty((n_p, 3))
+        out[order] = acc.T # back to the caller's ordering
+        if potential:
+            out_phi = np.empty(n_p)
+            out_phi[order] = phi
+            return out, out_phi
+        return out
@@ -1,6 +1,26 @@
+import time
 import pygame
 import numpy as np
 
+class LabelGrid:
+    # Spatial hash of placed label rects, so an overlap check only looks at labels in the same cells
+    def __init__(self, cell=32):
+        self.cell = cell
+        self.cells = {}
+
+    def _keys(self, rect):
+        c = self.cell
+        for cx in range(rect.left // c, (rect.right - 1) // c + 1):
+            for cy in range(rect.top // c, (rect.bottom - 1) // c + 1):
+                yield cx, cy
+
+    def collides(self, rect):
+        return any(rect.colliderect(other) for key in self._keys(rect) for other in self.cells.get(key, ()))
+
+    def add(self, rect):
+        for key in self._keys(rect):
+            self.cells.setdefault(key, []).append(rect)
+
 class PygameRenderer:
     def __init__(self, scale, screen_width=800, screen_height=600):
         pygame.init()
@@ -13,7 +33,7 @@ class PygameRenderer:
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.show_proj_label = False
-
+        self.paused = False  # toggled with space; the simulation worker is told to hold
 
         self.offset = np.array([screen_width / 2, screen_height / 2], dtype=float)
         self.scale = scale
@@ -35,6 +55,29 @@ class PygameRenderer:
         self.axis_len = self.camera_distance * 4
         self.update_axes()
 
+        self._view_key = None  # (yaw, pitch) the cached view matrix was built for
+        self._view_matrix = None
+
+        # Large scenes: above this many bodies, sub-pixel bodies become single-pixel splats without labels
+        self.point_mode_above = 1000
+        self._labels = {}  # name -> rendered label surface
+        self._texts = {}  # overlay text -> rendered surface, for texts that rarely change
+        self._plane_key = None  # (screen size, corners) the cached plane surface was drawn for
+        self._plane_surface = None
+        self._color_objects = None  # the object list the mapped colors below belong to
+        self._mapped_colors = None
+
+        # Replay: a (start, end) timeline adds a seek bar and the playback keys ([ ] speed, b reverse, , . step, home/end)
+        self.timeline = None
+        self.speed = 1.0  # simulated seconds per wall-clock second; negative plays backwards
+        self.seek_to = None  # time picked with the seek bar or keys, taken by the replay loop
+        self.seeking = False
+
+        # Instrumentation: the latest Stats.snapshot() of the simulation, shown as an overlay toggled with i
+        self.stats = None
+        self.show_stats = False
+        self.draw_seconds = 0.0  # wall time of the last draw, without the frame-rate wait
+
     def update_axes(self):
         base_len = 1e11  # a reasonable default length in world units
         zoom_factor = 1 / self.scale
@@ -53,16 +96,22 @@ class PygameRenderer:
                 return False
 
             elif event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1:  # Right click starts rotation
+                if event.button == 1 and self.timeline is not None and self._timeline_rect().inflate(0, 12).collidepoint(event.pos):
+                    self.seeking = True
+                    self.seek_to = self._timeline_time(event.pos[0])
+                elif event.button == 1:  # Right click starts rotation
                     self.rotating = True
                     self.last_mouse_pos_rot = np.array(pygame.mouse.get_pos(), dtype=float)
 
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:
                     self.rotating = False
+                    self.seeking = False
 
             elif event.type == pygame.MOUSEMOTION:
-                if self.rotating and self.last_mouse_pos_rot is not None:
+                if self.seeking:
+                    self.seek_to = self._timeline_time(event.pos[0])
+                elif self.rotating and self.last_mouse_pos_rot is not None:
                     current_pos = np.array(pygame.mouse.get_pos(), dtype=float)
                     delta = current_pos - self.last_mouse_pos_rot
                     sensitivity = 0.005
@@ -123,6 +172,10 @@ class PygameRenderer:
                         self.relative_orientation = True
                         self.ortho_mode = True
                         self.show_proj_label = True
+                elif event.key == pygame.K_SPACE:
+                    self.paused = not self.paused
+                elif event.key == pygame.K_i:
+                    self.show_stats = not self.show_stats
                 elif event.key == pygame.K_p:
                     # Reset orientation to default
                     self.yaw = np.pi / 4
@@ -130,9 +183,70 @@ class PygameRenderer:
                     self.relative_orientation = False
                     self.ortho_mode = False
                     self.show_proj_label = True
+                elif self.timeline is not None:
+                    self._replay_key(event.key)
 
         return True
 
+    def _replay_key(self, key):
+        start, end = self.timeline
+        if key == pygame.K_RIGHTBRACKET:
+            self.speed *= 2
+        elif key == pygame.K_LEFTBRACKET:
+            self.speed /= 2
+        elif key == pygame.K_b:
+            self.speed = -self.speed
+        elif key == pygame.K_COMMA:  # one wall-clock second of playback back or forward
+            self.seek_to = max(start, self.sim_time - abs(self.speed))
+        elif key == pygame.K_PERIOD:
+            self.seek_to = min(end, self.sim_time + abs(self.speed))
+        elif key == pygame.K_HOME:
+            self.seek_to = start
+        elif key == pygame.K_END:
+            self.seek_to = end
+
+    def _timeline_rect(self):
+        return pygame.Rect(10, self.screen_height - 20, self.screen_width - 20, 6)
+
+    def _timeline_time(self, x):
+        rect = self._timeline_rect()
+        start, end = self.timeline
+        return start + (end - start) * min(max((x - rect.left) / rect.width, 0.0), 1.0)
+
+    def _draw_timeline(self):
+        # Seek bar along the bottom edge, with the playback rate in days per second
+        rect = self._timeline_rect()
+        start, end = self.timeline
+        pygame.draw.rect(self.screen, (60, 60, 60), rect)
+        done = (self.sim_time - start) / (end - start) if end > start else 1.0
+        pygame.draw.rect(self.screen, (140, 140, 140), (rect.left, rect.top, int(rect.width * min(max(done, 0.0), 1.0)), rect.height))
+        state = "paused" if self.paused else f"{self.speed / 86400:+.3g} d/s"
+        self.screen.blit(self._text(state, (255, 255, 255)), (rect.left, rect.top - 14))
+
+    def _draw_stats(self):
+        # Per-phase shares of the simulation's wall time, its step rate and a histogram of recent step sizes
+        stats = self.stats
+        white = (255, 255, 255)
+        lines = [
+            f"steps/s {stats['steps_per_sec']:.0f}  dt {stats['dt']:.3g} s  steps {stats['steps']}",
+            f"force passes {stats['force_passes']}  interactions/s {stats['interactions_per_sec']:.3g}",
+            "  ".join(f"{phase} {share:.0%}" for phase, share in stats["share"].items() if share >= .005),
+            f"render {self.draw_seconds * 1000:.1f} ms/frame",
+        ]
+        x, y = 10, 90
+        for line in lines:
+            self.screen.blit(self.font.render(line, True, white), (x, y))
+            y += 14
+
+        hist = stats["dt_hist"]
+        if hist:
+            bins = sorted(hist.items(), key=lambda item: float(item[0]))
+            most = max(hist.values())
+            for k, (edge, count) in enumerate(bins):
+                height = max(1, int(30 * count / most))
+                pygame.draw.rect(self.screen, (120, 170, 255), (x + 14 * k, y + 32 - height, 12, height))
+            self.screen.blit(self._text(f"dt {bins[0][0]} .. {bins[-1][0]} s", white), (x, y + 34))
+
     def _cycle_tracked_object(self, objects, direction):
         if not objects:
             self.tracked_object = None
@@ -150,8 +264,11 @@ class PygameRenderer:
         self.yaw = np.pi/4
         self.pitch = np.pi/6
 
-    def rotate_point(self, pos):
-        pos = np.array(pos, dtype=float)
+    def view_matrix(self):
+        # Rebuilt only when the camera angles change, not once per projected point
+        key = (self.yaw, self.pitch)
+        if key == self._view_key:
+            return self._view_matrix
 
         # Use pitch directly, don't flip sign here, handle flipping only in projection if needed
         pitch = self.pitch  
@@ -170,11 +287,35 @@ class PygameRenderer:
         up = np.cross(forward, right)
 
         # Rotation matrix columns are right, up, forward (camera basis)
-        rot_matrix = np.column_stack((right, up, forward))
+        self._view_matrix = np.column_stack((right, up, forward))
+        self._view_key = key
+        return self._view_matrix
+
+    def rotate_point(self, pos):
+        # Rotate point (or an N x 3 array of points) into camera space
+        return np.asarray(pos, dtype=float) @ self.view_matrix()
+
+    def project_points(self, points):
+        # Screen positions of an N x 3 array in one matrix multiply, plus a mask of the drawable ones
+        rotated = self.rotate_point(np.asarray(points, dtype=float).reshape(-1, 3))
 
-        # Rotate point into camera space
-        rotated = rot_matrix.T @ pos
-        return rotated
+        if self.ortho_mode:
+            projected = rotated[:, :2]
+            valid = np.ones(len(rotated), dtype=bool)
+        else:
+            z_cam = rotated[:, 2] + self.camera_distance
+            near_plane = self.camera_distance * 0.001
+            valid = z_cam >= near_plane
+            with np.errstate(divide='ignore', invalid='ignore'):
+                factor = self.camera_distance / z_cam
+            # **Note:** don't invert y here, keep consistent
+            projected = np.column_stack((rotated[:, 0] * factor, -rotated[:, 1] * factor))
+
+        screen = projected * self.scale + self.offset
+        # Cull NaN/inf and anything far enough off screen to overflow pygame
+        with np.errstate(invalid='ignore'):
+            valid &= np.all(np.isfinite(screen), axis=1) & np.all(np.abs(screen) <= 1e9, axis=1)
+        return screen, valid
     
     def _orient_relative_to_tracked(self):
         # Switch to orthographic mode for top-down view
@@ -224,55 +365,88 @@ class PygameRenderer:
         # Update axes length based on current scale
         self.update_axes()
 
-        for start, end, color in self.axes.values():
-            p1 = self._project_and_scale(start)
-            p2 = self._project_and_scale(end)
-            if p1 is not None and p2 is not None:
-                pygame.draw.line(self.screen, color, p1.astype(int), p2.astype(int), 2)
+        self._draw_axes()
+
+    def _draw_axes(self):
+        # Both endpoints of every axis in one projection
+        ends = np.array([point for start, end, _ in self.axes.values() for point in (start, end)])
+        screen, valid = self.project_points(ends)
+        for k, (_, _, color) in enumerate(self.axes.values()):
+            if valid[2 * k] and valid[2 * k + 1]:
+                pygame.draw.line(self.screen, color, screen[2 * k].astype(int), screen[2 * k + 1].astype(int), 2)
 
     def draw_xy_plane(self):
         # Smaller size for XY plane (e.g., 1/4 of axis_len)
         plane_size = self.axis_len * 0.001
 
-        corners_3d = [
-            np.array([-plane_size, -plane_size, 0]),
-            np.array([-plane_size,  plane_size, 0]),
-            np.array([ plane_size,  plane_size, 0]),
-            np.array([ plane_size, -plane_size, 0]),
-        ]
+        corners_3d = np.array([
+            [-plane_size, -plane_size, 0],
+            [-plane_size,  plane_size, 0],
+            [ plane_size,  plane_size, 0],
+            [ plane_size, -plane_size, 0],
+        ])
 
-        corners_2d = [self._project_and_scale(c) for c in corners_3d]
+        corners_2d, valid = self.project_points(corners_3d)
         # Skip drawing if any corner is invalid
-        if any(c is None for c in corners_2d):
-            return
-
-        if any(c is None for c in corners_2d):
+        if not valid.all():
             return
 
         points = [c.astype(int) for c in corners_2d]
 
-        plane_surface = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA)
-
-        # Gray color with low alpha for subtlety (e.g., 50 out of 255)
-        gray_color = (150, 150, 150, 50)
-
-        pygame.draw.polygon(plane_surface, gray_color, points)
-        self.screen.blit(plane_surface, (0, 0))
-
-    def draw_object(self, obj, valid_point_func, drawn_positions, drawn_labels):
-        proj = self.project_3d_to_2d(obj.pos)
-        if not valid_point_func(proj):
-            return
-
-        screen_pos = proj * self.scale + self.offset
-        radius_px = max(2, int(obj.radius * self.scale))
-
+        # The plane surface is only redrawn when the camera moved it, and is reused between frames
+        key = (self.screen.get_size(), tuple(map(tuple, points)))
+        if key != self._plane_key:
+            if self._plane_surface is None or self._plane_surface.get_size() != key[0]:
+                self._plane_surface = pygame.Surface(key[0], pygame.SRCALPHA)
+            else:
+                self._plane_surface.fill((0, 0, 0, 0))
+
+            # Gray color with low alpha for subtlety (e.g., 50 out of 255)
+            gray_color = (150, 150, 150, 50)
+
+            pygame.draw.polygon(self._plane_surface, gray_color, points)
+            self._plane_key = key
+        self.screen.blit(self._plane_surface, (0, 0))
+
+    def _text(self, text, color):
+        # Cached font.render for overlay texts that repeat from frame to frame
+        key = (text, color)
+        if key not in self._texts:
+            if len(self._texts) > 256:
+                self._texts.clear()
+            self._texts[key] = self.font.render(text, True, color)
+        return self._texts[key]
+
+    def splat_points(self, screen, colors):
+        # One pixel per body, written straight into the screen's pixel array
+        w, h = self.screen.get_size()
+        xi = screen[:, 0].astype(int)
+        yi = screen[:, 1].astype(int)
+        inside = (xi >= 0) & (xi < w) & (yi >= 0) & (yi < h)
+        pixels = pygame.surfarray.pixels2d(self.screen)
+        pixels[xi[inside], yi[inside]] = colors[inside]
+        del pixels  # unlocks the screen
+
+    def mapped_colors(self, objects):
+        # Screen pixel values of every body's color, kept until the object list changes
+        if objects is not self._color_objects or len(self._mapped_colors) != len(objects):
+            lookup = {}
+            for obj in objects:
+                if obj.color not in lookup:
+                    lookup[obj.color] = self.screen.map_rgb(pygame.Color(obj.color))
+            self._mapped_colors = np.array([lookup[obj.color] for obj in objects], dtype=np.uint32)
+            self._color_objects = objects
+        return self._mapped_colors
+
+    def draw_object(self, obj, screen_pos, radius_px, drawn_positions, drawn_labels):
         # Always draw the object circle (never skip)
         pygame.draw.circle(self.screen, pygame.Color(obj.color), screen_pos.astype(int), radius_px)
         drawn_positions.append(screen_pos)  # optional: keep if you want for future use
 
         # Draw label with shifting to avoid label-to-label overlap only
-        label = self.font.render(obj.name, True, (255, 255, 255))
+        label = self._labels.get(obj.name)
+        if label is None:
+            label = self._labels[obj.name] = self.font.render(obj.name, True, (255, 255, 255))
         label_rect = label.get_rect()
 
         # Start label position near the object circle
@@ -282,20 +456,41 @@ class PygameRenderer:
         shift_step = 2  # pixels to shift down on overlap
 
         # Shift label down until it doesn't collide with any other label
-        while any(label_rect.colliderect(other_rect) for other_rect in drawn_labels):
+        while drawn_labels.collides(label_rect):
             label_rect.move_ip(0, shift_step)
 
         # Draw label and add its rect for future collision checks
         self.screen.blit(label, label_rect.topleft)
-        drawn_labels.append(label_rect)
-
-    def draw(self, objects, total_sim_time):
+        drawn_labels.add(label_rect)
 
-        for start, end, color in self.axes.values():
-            p1 = self._project_and_scale(start)
-            p2 = self._project_and_scale(end)
-            if p1 is not None and p2 is not None:
-                pygame.draw.line(self.screen, color, p1.astype(int), p2.astype(int), 2)
+    def draw_trails(self, objects, trails, positions):
+        # Every stored sample of every trail in one projection, then one polyline per visible run
+        paths, filled = trails.paths()
+        n = min(len(paths), len(objects))
+        if n == 0:
+            return
+        # close each trail on the body's current position
+        points = np.concatenate([paths[:n], positions[:n, None]], axis=1)
+        filled = np.concatenate([filled[:n], np.ones((n, 1), dtype=bool)], axis=1)
+
+        screen, valid = self.project_points(points.reshape(-1, 3))
+        screen = screen.reshape(n, -1, 2).astype(int)
+        valid = valid.reshape(n, -1) & filled
+
+        for i in range(n):
+            # split the trail wherever a sample is culled, and draw the runs of two or more points
+            breaks = np.flatnonzero(~valid[i])
+            color = pygame.Color(objects[i].color)
+            color = (color.r // 2, color.g // 2, color.b // 2)
+            for run in np.split(np.arange(valid.shape[1]), breaks):
+                run = run[valid[i, run]]
+                if len(run) >= 2:
+                    pygame.draw.lines(self.screen, color, False, screen[i, run])
+
+    def draw(self, objects, total_sim_time, arrays=None, trails=None):
+        # arrays: optional (pos, mass, radius) arrays in the order of objects, instead of reading them body by body
+        # trails: optional Trails whose rows line up with the first objects
+        draw_start = time.perf_counter()
 
         self.screen.fill((0, 0, 0))
         self.draw_xy_plane()
@@ -307,27 +502,43 @@ class PygameRenderer:
                 center_screen = np.array([self.screen_width / 2, self.screen_height / 2])
                 self.offset += center_screen - tracked_screen_pos
 
-        def valid_point(p):
-            return p is not None and p.shape == (2,) and not np.any(np.isnan(p)) and not np.any(np.isinf(p))
-
-        # Redraw axes on top for clarity
-        for start, end, color in self.axes.values():
-            p1 = self._project_and_scale(start)
-            p2 = self._project_and_scale(end)
-            if valid_point(p1) and valid_point(p2):
-                pygame.draw.line(self.screen, color, p1.astype(int), p2.astype(int), 2)
+        # Axes on top of the plane for clarity
+        self._draw_axes()
 
         drawn_positions = []
-        drawn_labels = []
-
-        for obj in sorted(objects, key=lambda o: o.mass):
-            self.draw_object(obj, valid_point, drawn_positions, drawn_labels)
+        drawn_labels = LabelGrid()
+
+        # Every body in one projection, drawn lightest first so heavy bodies end up on top
+        if len(objects):
+            if arrays is None:
+                arrays = (np.array([obj.pos for obj in objects]), np.array([obj.mass for obj in objects]),
+                          np.array([obj.radius for obj in objects]))
+            positions, masses, radii = arrays
+            if trails is not None:
+                self.draw_trails(objects, trails, positions)
+            screen, valid = self.project_points(positions)
+            true_px = radii * self.scale
+            radius_px = np.maximum(2, true_px.astype(int))
+
+            # Cull circles that lie entirely off screen
+            w, h = self.screen.get_size()
+            valid &= ((screen[:, 0] + radius_px >= 0) & (screen[:, 0] - radius_px < w)
+                      & (screen[:, 1] + radius_px >= 0) & (screen[:, 1] - radius_px < h))
+
+            if len(objects) > self.point_mode_above:
+                point = valid & (true_px < 1)
+                self.splat_points(screen[point], self.mapped_colors(objects)[point])
+                valid &= ~point
+
+            visible = np.flatnonzero(valid)
+            for i in visible[np.argsort(masses[visible], kind='stable')]:
+                self.draw_object(objects[i], screen[i], int(radius_px[i]), drawn_positions, drawn_labels)
 
         # Info texts
         width_px = self.screen.get_size()[0]
         km_per_pixel = 1 / self.scale / 1000 if self.scale != 0 else 0
         screen_km = width_px * km_per_pixel
-        zoom_text = self.font.render(f"Width: {screen_km:.2f} km", True, (255, 255, 255))
+        zoom_text = self._text(f"Width: {screen_km:.2f} km", (255, 255, 255))
         
         # Assign the total simulation time directly to the renderer's variable
         self.sim_time = total_sim_time
@@ -346,14 +557,21 @@ class PygameRenderer:
         # --- Projection mode indicator ---
         if self.show_proj_label:
             mode_text = "O" if self.ortho_mode else "P"
-            proj_label = self.font.render(mode_text, True, (0, 255, 0))
+            proj_label = self._text(mode_text, (0, 255, 0))
             label_rect = proj_label.get_rect()
             label_rect.topright = (self.screen_width - 10, 10)
             self.screen.blit(proj_label, label_rect.topleft)
 
+        if self.timeline is not None:
+            self._draw_timeline()
+
+        if self.show_stats and self.stats is not None:
+            self._draw_stats()
+
 
 
         pygame.display.flip()
+        self.draw_seconds = time.perf_counter() - draw_start
         self.clock.tick(60)
 
     def quit(self):
@@ -0,0 +1,135 @@
+# IMPORTS
+import numpy as np
+from multiprocessing import shared_memory
+
+
+# SNAPSHOT RING
+class SnapshotRing: # fixed-size ring of position snapshots in shared memory, one writer and any number of readers
+    # every slot is guarded by a sequence number that is odd while the writer is inside it, so a reader
+    # can tell a torn copy from a clean one without any lock
+    def __init__(self, capacity, slots=4, name=None):
+        if name is None:
+            capacity = max(capacity, 1)
+            shape = self._layout(capacity, slots)
+            self.shm = shared_memory.SharedMemory(create=True, size=shape["size"])
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            header = np.ndarray(3, dtype=np.int64, buffer=self.shm.buf)
+            slots, capacity = int(header[1]), int(header[2])
+            shape = self._layout(capacity, slots)
+
+        self.name = self.shm.name
+        self.capacity = capacity
+        self.slots = slots
+
+        def view(key, dtype, dims):
+            return np.ndarray(dims, dtype=dtype, buffer=self.shm.buf, offset=shape[key])
+
+        self.header = view("header", np.int64, (3,)) # published count, slots, capacity
+        self.seq = view("seq", np.int64, (slots,))
+        self.count = view("count", np.int64, (slots,))
+        self.layout = view("layout", np.int64, (slots,)) # which body list the rows of a slot belong to
+        self.time = view("time", np.float64, (slots,))
+        self.pos = view("pos", np.float64, (slots, capacity, 3))
+        self.mass = view("mass", np.float64, (slots, capacity))
+        self.radius = view("radius", np.float64, (slots, capacity))
+
+        if self.owner:
+            self.header[:] = (0, slots, capacity)
+            self.seq[:] = 0
+
+    @staticmethod
+    def _layout(capacity, slots): # byte offset of every array in the block
+        sizes = (("header", 3), ("seq", slots), ("count", slots), ("layout", slots), ("time", slots),
+                 ("pos", slots * capacity * 3), ("mass", slots * capacity), ("radius", slots * capacity))
+        offsets = {}
+        offset = 0
+        for key, items in sizes:
+            offsets[key] = offset
+            offset += 8 * items
+        offsets["size"] = offset
+        return offsets
+
+    def publish(self, t, layout, pos, mass, radius): # writer side: copy one snapshot into the next slot
+        n = len(pos)
+        if n > self.capacity:
+            raise ValueError(f"snapshot of {n} bodies does not fit a ring of capacity {self.capacity}")
+        k = self.header[0] % self.slots
+        self.seq[k] += 1 # odd: slot being written
+        self.count[k] = n
+        self.layout[k] = layout
+        self.time[k] = t
+        self.pos[k, :n] = pos
+        self.mass[k, :n] = mass
+        self.radius[k, :n] = radius
+        self.seq[k] += 1 # even: slot complete
+        self.header[0] += 1
+
+    def latest(self): # reader side: (time, layout, pos, mass, radius) of the newest clean snapshot, or None before the first
+        for _ in range(self.slots):
+            published = self.header[0]
+            if published == 0:
+                return None
+            k = (published - 1) % self.slots
+            seq = self.seq[k]
+            if seq % 2:
+                continue # the writer already lapped round to this slot
+            n = self.count[k]
+            snapshot = (self.time[k], self.layout[k], self.pos[k, :n].copy(), self.mass[k, :n].copy(), self.radius[k, :n].copy())
+            if self.seq[k] == seq:
+                return snapshot
+        return None
+
+    def close(self):
+        del self.header, self.seq, self.count, self.layout, self.time, self.pos, self.mass, self.radius # views must go before the buffer
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SnapshotBody: # read-only stand-in for a CelestialBody, backed by the viewer's current snapshot
+    def __init__(self, view, index, name, color):
+        self.view = view
+        self.index = index
+        self.name = name
+        self.color = color
+
+    @property
+    def pos(self):
+        return self.view.pos[self.index]
+
+    @property
+    def mass(self):
+        return self.view.mass[self.index]
+
+    @property
+    def radius(self):
+        return self.view.radius[self.index]
+
+
+class SnapshotView: # the latest snapshot as a list of body stand-ins the renderer can draw
+    def __init__(self, ring):
+        self.ring = ring
+        self.layouts = {} # layout id -> (names, colors), sent once per change of the body list
+        self.layout = None
+        self.objects = []
+        self.time = 0.0
+        self.pos = np.zeros((0, 3))
+        self.mass = np.zeros(0)
+        self.radius = np.zeros(0)
+
+    def refresh(self): # returns False until the first snapshot with a known layout has arrived
+        snapshot = self.ring.latest()
+        if snapshot is None or snapshot[1] not in self.layouts:
+            return bool(self.objects)
+
+        self.time, layout, self.pos, self.mass, self.radius = snapshot
+        if layout != self.layout: # bodies merged or were absorbed; rebuild the stand-ins
+            names, colors = self.layouts[layout]
+            self.objects = [SnapshotBody(self, i, name, color) for i, (name, color) in enumerate(zip(names, colors))]
+            self.layout = layout
+            for old in [k for k in self.layouts if k < layout]:
+                del self.layouts[old]
+        return True
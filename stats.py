@@ -0,0 +1,93 @@
+# IMPORTS
+import json
+import time
+import numpy as np
+
+# CONSTANTS/SETTINGS
+# timed phases; kick_drift is what is left of the integrator step once its force passes and adaptive_dt are taken out,
+# render is added by the viewer loops (headless runs leave it at 0)
+PHASES = ("force", "kick_drift", "adaptive_dt", "events", "collisions", "trails", "diagnostics", "io", "render")
+dt_edges = 10.0**np.arange(-2, 6.25, .25) # step-size histogram bin edges in seconds, four per decade from min_dt
+stats_interval = 5.0 # wall-clock seconds between report lines
+
+
+# STATS
+class Stats: # wall time per hot-path phase and work counters, cheap enough to leave attached to production runs
+    # each hook is one perf_counter pair; a World or Integrator without a Stats (stats = None) pays one attribute test
+    def __init__(self, interval=stats_interval, out=None):
+        # out: path or open text stream every report() is written to as one JSON line
+        self.seconds = dict.fromkeys(PHASES + ("integrator",), 0.0)
+        self.calls = dict.fromkeys(PHASES + ("integrator",), 0)
+        self.counters = {"steps": 0, "force_passes": 0, "body_evals": 0, "interactions": 0}
+        self.dt_counts = np.zeros(len(dt_edges) + 1, dtype=np.int64) # steps per bin since the last report
+        self.dt = 0.0
+        self.sim_time = 0.0
+        self.interval = interval
+        self.started = self.mark_time = time.perf_counter()
+        self.next_report = self.started + interval
+        self.last = (self.started, 0) # (wall, steps) of the last report, for the current steps/sec
+        self.own_file = isinstance(out, str)
+        self.file = open(out, "w") if self.own_file else out
+
+    def mark(self): # start of a run of consecutive phases timed with lap()
+        self.mark_time = time.perf_counter()
+
+    def lap(self, phase): # time since the last mark or lap goes to phase
+        now = time.perf_counter()
+        self.seconds[phase] += now - self.mark_time
+        self.calls[phase] += 1
+        self.mark_time = now
+
+    def add(self, phase, seconds):
+        self.seconds[phase] += seconds
+        self.calls[phase] += 1
+
+    def force(self, seconds, bodies, interactions): # one force pass
+        self.seconds["force"] += seconds
+        self.calls["force"] += 1
+        self.counters["force_passes"] += 1
+        self.counters["body_evals"] += bodies
+        self.counters["interactions"] += interactions
+
+    def step(self, t, dt): # after every step; writes a report line once per interval when there is an out
+        self.counters["steps"] += 1
+        self.sim_time = t
+        self.dt = dt
+        self.dt_counts[np.searchsorted(dt_edges, dt, side="right")] += 1 # bin k is [edges[k - 1], edges[k]), as labelled
+        if self.file is not None and time.perf_counter() >= self.next_report:
+            self.report()
+
+    def snapshot(self): # everything so far as plain numbers, for the overlay and the log
+        now = time.perf_counter()
+        wall = now - self.started
+        seconds = dict(self.seconds)
+        seconds["kick_drift"] += max(0.0, seconds.pop("integrator") - seconds["force"] - seconds["adaptive_dt"])
+        steps = self.counters["steps"]
+        since = now - self.last[0]
+        return {
+            "wall": wall,
+            "sim_time": self.sim_time,
+            "dt": self.dt,
+            "steps_per_sec": (steps - self.last[1]) / since if since > 0 else 0.0,
+            **self.counters,
+            "interactions_per_sec": self.counters["interactions"] / wall if wall > 0 else 0.0,
+            "seconds": seconds,
+            "share": {phase: seconds[phase] / wall if wall > 0 else 0.0 for phase in PHASES},
+            # lower bin edge (seconds) -> steps in that bin since the last report; 0 stands for anything below min_dt
+            "dt_hist": {f"{edge:.3g}": int(count) for edge, count in zip(np.concatenate([[0.0], dt_edges]), self.dt_counts) if count},
+        }
+
+    def report(self): # snapshot(), written as one JSON line if there is an out; starts the next steps/sec and dt window
+        snapshot = self.snapshot()
+        if self.file is not None:
+            self.file.write(json.dumps(snapshot) + "\n")
+            self.file.flush()
+        now = time.perf_counter()
+        self.last = (now, self.counters["steps"])
+        self.next_report = now + self.interval
+        self.dt_counts[:] = 0
+        return snapshot
+
+    def close(self):
+        if self.own_file:
+            self.file.close()
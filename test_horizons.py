@@ -0,0 +1,134 @@
+# HORIZONS CLIENT TESTS
+# run with: python -m pytest -q test_horizons.py
+# a local stand-in for the Horizons API serves canned VECTORS tables, so nothing here touches the network
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pytest
+from horizons import HorizonsClient, parse_table, parse_vectors
+from main import HORIZONS_IDS, EnvironmentBuilder
+
+EPOCH = "2025-08-12"
+JD = 2460899.5
+
+
+def state_of(body): # made-up state in km and km/s that differs per body id
+    k = float(body)
+    return [k * 1e6, -k * 1e5, k * 1e3, k * 1e-3, -k * 1e-2, k * 1e-4]
+
+
+def csv_table(body, epochs=2):
+    lines = []
+    for n in range(epochs):
+        x = state_of(body)
+        lines.append(f"{JD + n:.9f}, A.D. 2025-Aug-{12 + n:02d} 00:00:00.0000, " + ", ".join(f"{v: .15E}" for v in x) + ",")
+    return "*******\nJDTDB, Calendar Date (TDB), X, Y, Z, VX, VY, VZ,\n$$SOE\n" + "\n".join(lines) + "\n$$EOE\n*******\n"
+
+
+def text_table(body, epochs=2):
+    lines = []
+    for n in range(epochs):
+        x, y, z, vx, vy, vz = state_of(body)
+        lines += [f"{JD + n:.9f} = A.D. 2025-Aug-{12 + n:02d} 00:00:00.0000 TDB ",
+                  f" X ={x: .15E} Y ={y: .15E} Z ={z: .15E}",
+                  f" VX={vx: .15E} VY={vy: .15E} VZ={vz: .15E}"]
+    return "*******\n$$SOE\n" + "\n".join(lines) + "\n$$EOE\n*******\n"
+
+
+class Horizons(BaseHTTPRequestHandler): # answers every COMMAND with csv_table, or the error text Horizons gives for unknown ids
+    delay = 0.05 # seconds per response, long enough for concurrent requests to overlap
+    lock = threading.Lock()
+    served = 0
+    in_flight = 0
+    most_in_flight = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.served += 1
+            cls.in_flight += 1
+            cls.most_in_flight = max(cls.most_in_flight, cls.in_flight)
+        try:
+            body = parse_qs(urlparse(self.path).query)["COMMAND"][0].strip("'")
+            time.sleep(cls.delay)
+            text = csv_table(body) if body.isdigit() else f"No matches found for '{body}'.\n"
+            payload = text.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def log_message(self, *args): # keep pytest output clean
+        pass
+
+
+@pytest.fixture
+def server():
+    Horizons.served = Horizons.in_flight = Horizons.most_in_flight = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Horizons)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/api/horizons.api"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client(server, tmp_path):
+    return HorizonsClient(url=server, cache_dir=str(tmp_path / "cache"), workers=4)
+
+
+def test_fetch_all_is_concurrent(client):
+    bodies = list(HORIZONS_IDS.values())
+    texts = client.fetch_all(bodies, EPOCH)
+    assert set(texts) == set(bodies)
+    assert client.requests_made == Horizons.served == len(bodies)
+    assert Horizons.most_in_flight > 1
+    for body, text in texts.items():
+        pos, vel = parse_vectors(text)
+        assert np.allclose(pos + vel, np.array(state_of(body)) * 1000)
+
+
+def test_cache_hit_makes_no_requests(client, server, tmp_path):
+    bodies = list(HORIZONS_IDS.values())
+    first = client.state_vectors(bodies, EPOCH)
+    served = Horizons.served
+
+    again = HorizonsClient(url=server, cache_dir=str(tmp_path / "cache")) # a fresh client only has the disk cache
+    assert again.state_vectors(bodies, EPOCH) == first
+    assert again.requests_made == 0
+    assert Horizons.served == served
+
+
+def test_response_without_vectors_raises(client, tmp_path):
+    with pytest.raises(ValueError, match="no vectors"):
+        client.fetch("NotABody", EPOCH)
+    assert not list((tmp_path / "cache").glob("*")) # errors are not cached
+
+
+def test_environment_builder_horizons(client):
+    builder = EnvironmentBuilder()
+    builder.horizons(EPOCH, client=client)
+    reference = EnvironmentBuilder()
+    reference.solar_system()
+    masses = {body.name: body.mass for body in reference.objects}
+
+    assert [body.name for body in builder.objects] == list(HORIZONS_IDS)
+    for body in builder.objects:
+        assert body.mass == masses[body.name]
+        x = np.array(state_of(HORIZONS_IDS[body.name])) * 1000
+        assert np.allclose(body.pos, x[:3]) and np.allclose(body.vel, x[3:])
+
+
+@pytest.mark.parametrize("layout", [csv_table, text_table])
+def test_parse_table_layouts(layout):
+    jd, states = parse_table(layout(599, epochs=3))
+    assert np.allclose(jd, JD + np.arange(3))
+    assert states.shape == (3, 6)
+    assert np.allclose(states, np.array(state_of(599)) * 1000)
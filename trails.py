@@ -0,0 +1,93 @@
+# IMPORTS
+import numpy as np
+
+# CONSTANTS/SETTINGS
+trail_capacity = 512 # samples kept per body; older ones are overwritten
+trail_interval = 86400.0 # simulated seconds between candidate samples
+trail_angle = .02 # radians the path must turn before a candidate is kept
+trail_max_skip = 16 # candidates dropped in a row before one is kept anyway, so straight paths still get samples
+
+
+# TRAILS
+class Trails: # per-body ring buffers of past positions; memory is fixed at construction however long the run
+    def __init__(self, rows, capacity=trail_capacity, interval=trail_interval, angle=trail_angle, buffer=None):
+        # rows is the most bodies ever tracked; buffer (e.g. a SharedMemory.buf) lets another process read the trails
+        self.capacity = capacity
+        self.max_rows = rows
+        self.interval = interval
+        self.cos_angle = np.cos(angle)
+        self.next_time = -np.inf
+        self.bodies = [] # body of each row, to follow rows through merges
+        self.skipped = np.zeros(rows, dtype=np.int64)
+
+        if buffer is None:
+            buffer = bytearray(self.size(rows, capacity))
+        self.header = np.ndarray(1, dtype=np.int64, buffer=buffer) # rows in use
+        self.head = np.ndarray(rows, dtype=np.int64, buffer=buffer, offset=8) # next slot to write, per row
+        self.length = np.ndarray(rows, dtype=np.int64, buffer=buffer, offset=8 + 8 * rows)
+        self.pos = np.ndarray((rows, capacity, 3), dtype=np.float64, buffer=buffer, offset=8 + 16 * rows)
+
+    @staticmethod
+    def size(rows, capacity): # bytes needed for a buffer
+        return 8 + 16 * rows + 24 * rows * capacity
+
+    @property
+    def rows(self):
+        return int(self.header[0])
+
+    def sync(self, bodies): # follow bodies that moved rows (merges, removals) and start empty trails for new ones
+        old_row = {id(body): i for i, body in enumerate(self.bodies)}
+        src = np.array([old_row.get(id(body), -1) for body in bodies], dtype=np.int64)
+        if len(src) > self.max_rows:
+            raise ValueError(f"{len(src)} bodies do not fit trails sized for {self.max_rows}")
+
+        kept = src >= 0
+        dst = np.flatnonzero(kept)
+        src = src[kept]
+        # fancy indexing copies the sources before writing, so rows can move in any direction
+        self.head[dst] = self.head[src]
+        self.length[dst] = self.length[src]
+        self.skipped[dst] = self.skipped[src]
+        self.pos[dst] = self.pos[src]
+        new = np.flatnonzero(~kept)
+        self.head[new] = 0
+        self.length[new] = 0
+        self.skipped[new] = 0
+
+        self.bodies = list(bodies)
+        self.header[0] = len(self.bodies)
+
+    def record(self, t, state): # called after every step; keeps a sample per interval where the path bends
+        if t < self.next_time:
+            return
+        self.next_time = t + self.interval
+        if len(state.bodies) != len(self.bodies) or any(a is not b for a, b in zip(state.bodies, self.bodies)):
+            self.sync(state.bodies)
+
+        n = self.rows
+        pos = state.pos[:n]
+        rows = np.arange(n)
+        cap = self.capacity
+        last = self.pos[rows, (self.head[:n] - 1) % cap]
+        prev = self.pos[rows, (self.head[:n] - 2) % cap]
+
+        # turn angle between the last stored segment and the step to the candidate
+        seg = last - prev
+        new = pos - last
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cos = np.einsum('ij,ij->i', seg, new) / (np.linalg.norm(seg, axis=1) * np.linalg.norm(new, axis=1))
+        store = (self.length[:n] < 2) | (cos < self.cos_angle) | (self.skipped[:n] >= trail_max_skip) # nan (no motion) never bends
+
+        idx = np.flatnonzero(store)
+        self.pos[idx, self.head[idx]] = pos[idx]
+        self.head[idx] = (self.head[idx] + 1) % cap
+        self.length[idx] = np.minimum(self.length[idx] + 1, cap)
+        self.skipped[idx] = 0
+        self.skipped[np.flatnonzero(~store)] += 1
+
+    def paths(self): # (rows, capacity, 3) samples oldest first, and a (rows, capacity) mask of the filled ones
+        n = self.rows
+        cap = self.capacity
+        order = (self.head[:n, None] - self.length[:n, None] + np.arange(cap)) % cap
+        filled = np.arange(cap) < self.length[:n, None]
+        return self.pos[np.arange(n)[:, None], order], filled
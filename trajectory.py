@@ -0,0 +1,239 @@
+# IMPORTS
+import json
+import os
+import queue
+import threading
+import numpy as np
+from interpolation import hermite
+from snapshots import SnapshotBody
+
+# CONSTANTS/SETTINGS
+trajectory_interval = 86400.0 # simulated seconds between samples
+chunk_bytes = 16 * 2**20 # states buffered per chunk before it goes to disk; bounds memory however many bodies
+queue_depth = 2 # full chunks waiting for the writer thread before record() blocks
+
+
+# TRAJECTORY WRITER
+class TrajectoryWriter: # appends sampled states to a directory of chunks on a background thread
+    # the directory holds index.json (per chunk: file stem, sample count, first and last time, layout id),
+    # layout_NNNNNN.json (name, color, mass and radius of every row, once per change of the body list) and per chunk
+    # NNNNNN.npy (samples x bodies x 6, position then velocity) and NNNNNN.time.npy; a chunk is listed in the
+    # index only once its files are complete, so a killed run leaves every listed chunk readable
+    def __init__(self, path, interval=trajectory_interval, resume=None):
+        # resume is the time of the checkpoint a run restarts from: samples after it are dropped, the rest kept
+        self.path = path
+        self.interval = interval
+        os.makedirs(path, exist_ok=True)
+        self.chunks = []
+        if resume is not None and os.path.exists(os.path.join(path, "index.json")):
+            self._resume(resume)
+        self._write_index()
+        listed = {chunk["stem"] for chunk in self.chunks} | {f"layout_{chunk['layout']:06d}" for chunk in self.chunks}
+        for name in os.listdir(path): # chunks of an earlier run, or written past the checkpoint being resumed
+            if name.endswith((".npy", ".json")) and name != "index.json" and name.split(".")[0] not in listed:
+                os.remove(os.path.join(path, name))
+        self.next_time = self.chunks[-1]["t1"] + interval if self.chunks else -np.inf
+
+        self.bodies = [] # body of each row of the open chunk
+        self.layout = self.chunks[-1]["layout"] if self.chunks else -1
+        self.new_layout = None # description of a new layout, until the chunk that introduces it is queued
+        self.times = None
+        self.states = None
+        self.filled = 0
+        self.next_chunk = len(self.chunks)
+        self.error = None
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+        self.thread.start()
+
+    def _resume(self, t):
+        with open(os.path.join(self.path, "index.json")) as f:
+            chunks = json.load(f)["chunks"]
+        for chunk in chunks:
+            if chunk["t0"] > t:
+                break
+            if chunk["t1"] > t: # the run went past the checkpoint inside this chunk; keep its head only
+                times = np.load(self._file(chunk, "time"))
+                keep = int(np.searchsorted(times, t, side="right"))
+                states = np.load(self._file(chunk, "states"), mmap_mode="r")[:keep].copy()
+                chunk = dict(chunk, stem=f"{len(self.chunks):06d}r", samples=keep, t1=float(times[keep - 1]))
+                self._save(chunk, times[:keep], states)
+            self.chunks.append(chunk)
+
+    def _file(self, chunk, kind):
+        return os.path.join(self.path, f"{chunk['stem']}.time.npy" if kind == "time" else f"{chunk['stem']}.npy")
+
+    def _save(self, chunk, times, states): # both files written under temporary names, then moved into place
+        for kind, data in (("states", states), ("time", times)):
+            final = self._file(chunk, kind)
+            tmp = f"{final}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp, final)
+
+    def _write_index(self):
+        final = os.path.join(self.path, "index.json")
+        with open(f"{final}.tmp", "w") as f:
+            json.dump({"chunks": self.chunks}, f)
+        os.replace(f"{final}.tmp", final)
+
+    def _drain(self): # writer thread: the only place files are written once the writer is open
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            chunk, layout, times, states = item
+            try:
+                if self.error is None:
+                    if layout is not None:
+                        final = os.path.join(self.path, f"layout_{chunk['layout']:06d}.json")
+                        with open(f"{final}.tmp", "w") as f:
+                            json.dump(layout, f)
+                        os.replace(f"{final}.tmp", final)
+                    self._save(chunk, times, states)
+                    self.chunks.append(chunk)
+                    self._write_index()
+            except OSError as e:
+                self.error = e
+
+    def record(self, t, world): # called after every step; keeps one sample per interval
+        if t < self.next_time:
+            return
+        if self.error is not None:
+            raise self.error
+        self.next_time = t + self.interval
+
+        objects = world.objects
+        if len(objects) != len(self.bodies) or any(a is not b for a, b in zip(objects, self.bodies)):
+            self.flush() # merges and absorptions change the rows, which start a new chunk
+            self.bodies = objects
+            self.layout += 1
+            self.new_layout = {"name": [body.name for body in objects], "color": [body.color for body in objects],
+                               "mass": np.concatenate([world.state.mass, world.tests.mass]).tolist(),
+                               "radius": np.concatenate([world.state.radius, world.tests.radius]).tolist()}
+        if self.states is None:
+            rows = max(len(self.bodies), 1)
+            capacity = max(1, chunk_bytes // (48 * rows))
+            self.times = np.empty(capacity)
+            self.states = np.empty((capacity, len(self.bodies), 6))
+
+        i = self.filled
+        m = len(world.state)
+        self.times[i] = t
+        self.states[i, :m, :3] = world.state.pos
+        self.states[i, :m, 3:] = world.state.vel
+        self.states[i, m:, :3] = world.tests.pos
+        self.states[i, m:, 3:] = world.tests.vel
+        self.filled += 1
+        if self.filled == len(self.times):
+            self.flush()
+
+    def flush(self): # hands the open chunk to the writer thread; blocks only while queue_depth chunks are pending
+        if not self.filled:
+            return
+        n = self.filled
+        chunk = {"stem": f"{self.next_chunk:06d}", "samples": n, "t0": float(self.times[0]), "t1": float(self.times[n - 1]),
+                 "layout": self.layout}
+        self.queue.put((chunk, self.new_layout, self.times[:n], self.states[:n]))
+        self.new_layout = None
+        self.times = self.states = None # the thread owns those buffers now; the next sample starts fresh ones
+        self.filled = 0
+        self.next_chunk += 1
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+# TRAJECTORY
+class Trajectory: # read side of a TrajectoryWriter directory; chunks are memory-mapped when first touched
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.chunks = json.load(f)["chunks"]
+        self.loaded = {}
+        self.layouts = {}
+        self.carried = {} # (layout, next layout) -> row in the next layout of every row, -1 where the body is gone
+        self.times = np.concatenate([self.chunk(k)[0] for k in range(len(self.chunks))]) if self.chunks else np.zeros(0)
+        self.starts = np.cumsum([0] + [chunk["samples"] for chunk in self.chunks]) # first sample of every chunk
+
+    def __len__(self):
+        return len(self.times)
+
+    def chunk(self, k): # (times, states, layout id) of chunk k
+        if k not in self.loaded:
+            chunk = self.chunks[k]
+            stem = os.path.join(self.path, chunk["stem"])
+            self.loaded[k] = (np.load(f"{stem}.time.npy"), np.load(f"{stem}.npy", mmap_mode="r"), chunk["layout"])
+        return self.loaded[k]
+
+    def layout(self, layout): # {"name", "color", "mass", "radius"} lists, one entry per row
+        if layout not in self.layouts:
+            with open(os.path.join(self.path, f"layout_{layout:06d}.json")) as f:
+                self.layouts[layout] = json.load(f)
+        return self.layouts[layout]
+
+    def sample(self, i): # (time, states, layout id) of sample i over the whole run
+        k = int(np.searchsorted(self.starts, i, side="right")) - 1
+        times, states, layout = self.chunk(k)
+        return times[i - self.starts[k]], states[i - self.starts[k]], layout
+
+    def at(self, t): # (positions, layout id) at any time, cubic Hermite between the two samples around it
+        # reads those two samples only, so the cost of a frame does not depend on the length of the recording
+        i = int(np.clip(np.searchsorted(self.times, t, side="right") - 1, 0, len(self.times) - 1))
+        t0, s0, layout = self.sample(i)
+        if i + 1 == len(self.times):
+            return np.array(s0[:, :3]), layout
+        t1, s1, next_layout = self.sample(i + 1)
+        if next_layout != layout: # bodies merged or were absorbed in between: match rows by name
+            rows = self.carry(layout, next_layout)
+            gone = rows < 0
+            s1 = s1[rows]
+            s1[gone, :3] = s0[gone, :3] + s0[gone, 3:] * (t1 - t0) # a body that disappeared coasts in a straight line
+            s1[gone, 3:] = s0[gone, 3:]
+        h = t1 - t0
+        s = min(max((t - t0) / h, 0.0), 1.0)
+        return hermite(s0[:, :3], s0[:, 3:], s1[:, :3], s1[:, 3:], h, s), layout
+
+    def carry(self, layout, next_layout):
+        key = (layout, next_layout)
+        if key not in self.carried:
+            row = {name: i for i, name in enumerate(self.layout(next_layout)["name"])}
+            self.carried[key] = np.array([row.get(name, -1) for name in self.layout(layout)["name"]], dtype=np.int64)
+        return self.carried[key]
+
+    def body(self, name): # (times, states) of one body across every chunk it appears in
+        times, states = [], []
+        for k, chunk in enumerate(self.chunks):
+            names = self.layout(chunk["layout"])["name"]
+            if name in names:
+                t, s, _ = self.chunk(k)
+                times.append(t)
+                states.append(s[:, names.index(name)])
+        if not times:
+            raise KeyError(name)
+        return np.concatenate(times), np.concatenate(states)
+
+
+class TrajectoryView: # a Trajectory at one chosen time, as body stand-ins the renderer can draw (see SnapshotView)
+    def __init__(self, trajectory):
+        self.trajectory = trajectory
+        self.layout = None
+        self.objects = []
+        self.time = 0.0
+        self.pos = np.zeros((0, 3))
+        self.mass = np.zeros(0)
+        self.radius = np.zeros(0)
+
+    def seek(self, t):
+        self.time = t
+        self.pos, layout = self.trajectory.at(t)
+        if layout != self.layout:
+            rows = self.trajectory.layout(layout)
+            self.mass = np.array(rows["mass"])
+            self.radius = np.array(rows["radius"])
+            self.objects = [SnapshotBody(self, i, name, color) for i, (name, color) in enumerate(zip(rows["name"], rows["color"]))]
+            self.layout = layout